@@ -0,0 +1,213 @@
+"""Run main.py end to end against a local FTP server and a fake vendor site.
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/bench_e2e.py [--orders 20] [--latency 0.05] [--upload-mode selenium|http]
+                                   [--asset-latency 0.3] [--env ORDER_UPLOAD_WORKERS=2 ...] [--keep]
+
+Each run copies the code into a temp directory (no .env, cookies, ledger or state from this
+checkout), puts --orders synthetic order files in /out/orders and runs `python main.py` against
+benchmarks/fake_vendor.py. It reports wall time, the time of each stage and of the slowest spans
+(from the METRICS_SPANS_FILE output), and orders per minute, and checks every order reached the
+vendor exactly once. The selenium mode needs Chrome installed; --upload-mode http runs without a browser.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import logging
+import argparse
+import tempfile
+import subprocess
+import statistics
+from urllib.request import urlopen
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_vendor import USERNAME, PASSWORD, run_vendor, run_ftp_server
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+ORDER_HEADER = ['PO Number', 'First Name', 'Last Name', 'Address 1', 'Address 2', 'City', 'State', 'Zip', 'Phone', 'SKU', 'Qty']
+
+def write_orders(directory, count, rows_per_order, invalid=0):
+    # the first `invalid` files have an unquoted comma in their last row's address, so that row has one
+    # field too many, and should be quarantined
+    for n in range(count):
+        with open(os.path.join(directory, f"orders_{n:04d}.csv"), 'w', newline='') as f:
+            f.write(','.join(ORDER_HEADER) + '\r\n')
+            for r in range(rows_per_order):
+                po = 700000 + n * rows_per_order + r
+                address = f"{r + 1} Main St, Apt 2" if n < invalid and r == rows_per_order - 1 else f"{r + 1} Main St"
+                f.write(f"#{po},Ann,Smith,{address},,Boston,MA,02110,555-0100,SKU-{po % 500},{1 + r % 3}\r\n")
+
+def unused_port():
+    # nothing listens here, so SMTP fails fast instead of reaching gmail
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def copy_app(destination):
+    shutil.copytree(ROOT, destination, ignore=shutil.ignore_patterns(
+        '.env', '.git', 'benchmarks', '__pycache__', 'metrics', 'requests.jsonl',
+        '*.sqlite3*', 'session_cookies.json*', 'chrome_profiles', 'inventory_state.json', 'inventory_cookies.json', 'run_state.json', 'wait_stats.json',
+    ))
+
+def read_spans(path):
+    spans = []
+    if os.path.isfile(path):
+        with open(path) as f:
+            spans = [json.loads(line) for line in f if line.strip()]
+    return spans
+
+def run_once(args, run_dir):
+    ftp_root = os.path.join(run_dir, 'ftp')
+    app_dir = os.path.join(run_dir, 'app')
+    orders_dir = os.path.join(run_dir, 'orders')
+    processed_dir = os.path.join(run_dir, 'processed')
+    quarantine_dir = os.path.join(run_dir, 'quarantine')
+    os.makedirs(orders_dir)
+    copy_app(app_dir)
+
+    ftp_server, ftp_port = run_ftp_server(ftp_root, latency=args.ftp_latency)
+    write_orders(os.path.join(ftp_root, 'out', 'orders'), args.orders, args.rows_per_order, args.invalid_orders)
+    vendor = run_vendor(
+        latency=args.latency, submit_latency=args.submit_latency,
+        tracking_rows=args.tracking_rows, inventory_rows=args.inventory_rows,
+        address_prompt_rate=args.address_prompt_rate, asset_latency=args.asset_latency,
+    )
+    base = vendor.base_url
+
+    env = {k: v for k, v in os.environ.items() if not k.startswith(('FTP_', 'ORDER', 'TRACKING', 'INVENTORY', 'METRICS', 'EMAIL', 'SMTP'))}
+    env.update({
+        'LOGIN_USERNAME': USERNAME, 'LOGIN_PASSWORD': PASSWORD,
+        'LOGIN_URL': f"{base}/login", 'UPLOAD_URL': f"{base}/upload",
+        'ORDERS_PAGE_URL': f"{base}/orders", 'TRACKING_EXPORT_URL': f"{base}/orders/export.csv",
+        'INVENTORY_LOGIN_URL': f"{base}/inventory/login", 'INVENTORY_FILE_URL': f"{base}/inventory/feed.csv",
+        'FTP_HOST': '127.0.0.1', 'FTP_PORT': str(ftp_port), 'FTP_USER': 'bench', 'FTP_PASS': 'bench',
+        'LOCAL_ORDERS_DIR': orders_dir, 'LOCAL_PROCESSED_DIR': processed_dir,
+        'INVENTORY_OUTPUT_PATH': os.path.join(run_dir, 'shopify.csv'),
+        'METRICS_SPANS_FILE': os.path.join(run_dir, 'spans.jsonl'),
+        'METRICS_TEXTFILE': os.path.join(run_dir, 'perfumebot.prom'),
+        'SENDER_EMAIL': 'bot@example.com', 'RECEIVER_EMAIL': 'ops@example.com',
+        'SMTP_HOST': '127.0.0.1', 'SMTP_PORT': str(unused_port()), 'SMTP_TIMEOUT': '2',
+        'ORDER_UPLOAD_MODE': 'http' if args.upload_mode == 'http' else 'selenium',
+        'TRACKING_DOWNLOAD_MODE': 'http' if args.upload_mode == 'http' else 'selenium',
+    })
+    for setting in args.env:
+        name, _, value = setting.partition('=')
+        env[name] = value
+
+    start = time.perf_counter()
+    with open(os.path.join(run_dir, 'main.log'), 'w') as log:
+        result = subprocess.run([sys.executable, 'main.py', *args.main_args], cwd=app_dir, env=env,
+                                stdout=log, stderr=subprocess.STDOUT, timeout=args.timeout)
+    wall = time.perf_counter() - start
+
+    with urlopen(f"{base}/_stats") as response:
+        stats = json.load(response)
+    vendor.shutdown()
+    ftp_server.close_all()
+
+    return {
+        'wall': wall,
+        'exit_code': result.returncode,
+        'spans': read_spans(os.path.join(run_dir, 'spans.jsonl')),
+        'vendor': stats,
+        'archived': len([f for f in os.listdir(os.path.join(ftp_root, 'out', 'orders', 'archive')) if f.endswith('.csv')]),
+        'left_on_ftp': len([f for f in os.listdir(os.path.join(ftp_root, 'out', 'orders')) if f.endswith('.csv')]),
+        'processed': len(os.listdir(processed_dir)) if os.path.isdir(processed_dir) else 0,
+        'quarantined': len([f for f in os.listdir(quarantine_dir) if f.endswith('.csv')]) if os.path.isdir(quarantine_dir) else 0,
+        'fulfillments': os.listdir(os.path.join(ftp_root, 'in', 'fulfillments')),
+        'inventory': os.listdir(os.path.join(ftp_root, 'in', 'inventory')),
+    }
+
+def run_ok(args, run):
+    """every valid order file reached the vendor exactly once. counted in order rows and source files
+    moved to processed rather than batches, since ORDER_COALESCE sends several files as one batch"""
+    valid = args.orders - args.invalid_orders
+    duplicates = len(run['vendor']['files']) - len(set(run['vendor']['files']))
+    return (run['vendor']['order_rows'] == valid * args.rows_per_order and run['processed'] == valid
+            and duplicates == 0 and run['archived'] == args.orders and run['quarantined'] == args.invalid_orders)
+
+def report(args, runs):
+    print(f"\n{args.orders} order file(s) x {args.rows_per_order} row(s), upload mode {args.upload_mode}, "
+          f"vendor latency {args.latency}s (+{args.submit_latency}s per submit), FTP latency {args.ftp_latency}s")
+    if args.env:
+        print(f"settings: {' '.join(args.env)}")
+
+    for i, run in enumerate(runs, 1):
+        stages = {s['span'][len('stage.'):]: s['seconds'] for s in run['spans'] if s['span'].startswith('stage.')}
+        orders_seconds = stages.get('orders') or run['wall']
+        batches = run['vendor']['batches']
+        print(f"\nrun {i}: exit code {run['exit_code']}, wall {run['wall']:.2f}s, "
+              f"{run['processed'] / orders_seconds * 60:.1f} order files/min over the orders stage ({orders_seconds:.2f}s)")
+        print("  stages:   " + ', '.join(f"{name} {seconds:.2f}s" for name, seconds in stages.items()))
+        print(f"  vendor logins: site {run['vendor']['logins']['site']}, inventory {run['vendor']['logins']['inventory']}")
+        pages = {}
+        for s in run['spans']:
+            if s['span'].startswith('page.'):
+                pages.setdefault(s['span'][len('page.'):], []).append(s['seconds'])
+        if pages:
+            print("  page loads (median): " + ', '.join(f"{name} {statistics.median(times):.2f}s x{len(times)}" for name, times in pages.items())
+                  + f", {run['vendor']['asset_requests']} asset request(s)")
+
+        totals = {}
+        for s in run['spans']:
+            if not s['span'].startswith('stage.'):
+                count, seconds = totals.get(s['span'], (0, 0.0))
+                totals[s['span']] = (count + 1, seconds + s['seconds'])
+        slowest = sorted(totals.items(), key=lambda item: -item[1][1])[:args.top]
+        print("  slowest spans (total):")
+        for name, (count, seconds) in slowest:
+            print(f"    {name:28s} {seconds:8.2f}s  x{count}")
+
+        duplicates = len(run['vendor']['files']) - len(set(run['vendor']['files']))
+        valid = args.orders - args.invalid_orders
+        print(f"  vendor batches {batches}, order rows {run['vendor']['order_rows']}/{valid * args.rows_per_order} "
+              f"(duplicates: {duplicates}), archived on FTP {run['archived']}, "
+              f"left in /out/orders {run['left_on_ftp']}, moved to processed {run['processed']}, quarantined {run['quarantined']}, "
+              f"fulfillments {run['fulfillments'] or '-'}, inventory {run['inventory'] or '-'}  -> {'OK' if run_ok(args, run) else 'MISMATCH'}")
+
+    if len(runs) > 1:
+        print(f"\nmedian wall time over {len(runs)} runs: {statistics.median(r['wall'] for r in runs):.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=20, help='number of order files on the FTP')
+    parser.add_argument('--rows-per-order', type=int, default=5)
+    parser.add_argument('--invalid-orders', type=int, default=0, help='how many of the order files have a bad row')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every vendor request')
+    parser.add_argument('--submit-latency', type=float, default=0.5, help='extra seconds for each order submit')
+    parser.add_argument('--ftp-latency', type=float, default=0.0, help='seconds added to every FTP command')
+    parser.add_argument('--address-prompt-rate', type=float, default=0.2, help='share of uploads that get the address prompt')
+    parser.add_argument('--asset-latency', type=float, default=None,
+                        help='give every page images, a font and an analytics script that take this long each')
+    parser.add_argument('--tracking-rows', type=int, default=1000)
+    parser.add_argument('--inventory-rows', type=int, default=5000)
+    parser.add_argument('--upload-mode', choices=['selenium', 'http'], default='selenium')
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE', help='extra setting for main.py, repeatable')
+    parser.add_argument('--main-args', nargs='*', default=[], help='arguments passed to main.py, e.g. --precheck')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--top', type=int, default=10, help='how many of the slowest spans to show')
+    parser.add_argument('--timeout', type=float, default=1800)
+    parser.add_argument('--keep', action='store_true', help='keep the temp directory (logs, spans, FTP tree)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)  # keeps pyftpdlib's per-command log out of the report
+
+    runs = []
+    for _ in range(args.repeat):
+        run_dir = tempfile.mkdtemp(prefix='perfumebot-e2e-')
+        try:
+            runs.append(run_once(args, run_dir))
+        finally:
+            if args.keep:
+                print(f"kept {run_dir}")
+            else:
+                shutil.rmtree(run_dir, ignore_errors=True)
+    report(args, runs)
+    sys.exit(0 if all(run_ok(args, run) for run in runs) else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Report import cost (`python -X importtime`) for the entry point and each stage.
+
+    python benchmarks/bench_imports.py [--max-main-ms 250]
+
+Exits non-zero if `import main` pulls in selenium, pandas, requests or smtplib, or takes
+longer than --max-main-ms, so a new top-level import shows up as a regression.
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+TARGETS = ['main', 'utils.precheck', 'scrape_inventory', 'upload_workers', 'scrape_tracking']
+HEAVY_MODULES = ('selenium', 'pandas', 'requests', 'smtplib')
+
+def import_times(module):
+    """{imported module: cumulative microseconds} for a fresh `import module`"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--max-main-ms', type=float, default=250)
+    args = parser.parse_args()
+
+    failed = False
+    for target in TARGETS:
+        times = import_times(target)
+        heavy = sorted(name for name in times if name.split('.')[0] in HEAVY_MODULES and '.' not in name)
+        total_ms = times[target] / 1000
+        print(f"{target:20s} {total_ms:8.1f} ms   heavy imports: {', '.join(heavy) or '-'}")
+
+        if target == 'main':
+            if heavy:
+                print(f"  FAIL: importing main pulls in {heavy}")
+                failed = True
+            if total_ms > args.max_main_ms:
+                print(f"  FAIL: importing main took {total_ms:.1f} ms (limit {args.max_main_ms} ms)")
+                failed = True
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
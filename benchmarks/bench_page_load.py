@@ -0,0 +1,90 @@
+"""Compare page-load times of the default and the lean Chrome profile (utils/selenium_setup.py).
+
+    python benchmarks/bench_page_load.py [--loads 10] [--latency 0.05] [--asset-latency 0.3]
+
+Starts benchmarks/fake_vendor.py with page assets (a stylesheet, a web font, two images and an
+analytics script, each taking --asset-latency seconds), logs in once per browser and times
+driver.get() on the login, upload and orders pages --loads times each, first with the old
+default Chrome (CHROME_LEAN=false) and then with the lean one (whatever CHROME_* settings are in
+the environment). --profile-dir gives the lean browser an on-disk profile so its cache is kept.
+Needs Chrome installed.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import http.client
+from urllib.parse import urlparse, urlencode
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_vendor import USERNAME, PASSWORD, run_vendor
+
+PAGES = {'login': '/login', 'upload': '/upload', 'orders': '/orders?status=2&view=50'}
+
+def login_cookie(base_url):
+    url = urlparse(base_url)
+    connection = http.client.HTTPConnection(url.hostname, url.port)
+    connection.request('POST', '/login', urlencode({'user': USERNAME, 'pw': PASSWORD}),
+                       {'Content-Type': 'application/x-www-form-urlencoded'})
+    cookie = connection.getresponse().getheader('Set-Cookie')
+    connection.close()
+    return cookie.split(';')[0].split('=', 1)
+
+def p90(times):
+    return sorted(times)[int(0.9 * (len(times) - 1))]
+
+def time_pages(vendor, lean, loads, profile_dir=None):
+    from utils.selenium_setup import get_headless_driver
+
+    base = vendor.base_url
+    driver = get_headless_driver(profile_dir=profile_dir, lean=lean)
+    try:
+        name, value = login_cookie(base)
+        driver.get(f"{base}/login")
+        driver.add_cookie({'name': name, 'value': value, 'path': '/'})
+        assets_before = vendor.state.stats()['asset_requests']
+
+        times = {page: [] for page in PAGES}
+        for _ in range(loads):
+            for page, path in PAGES.items():
+                start = time.perf_counter()
+                driver.get(base + path)
+                times[page].append(time.perf_counter() - start)
+        return times, vendor.state.stats()['asset_requests'] - assets_before
+    finally:
+        driver.quit()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--loads', type=int, default=10, help='loads of each page per browser')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every page request')
+    parser.add_argument('--asset-latency', type=float, default=0.3, help='seconds each image/font/script takes')
+    parser.add_argument('--profile-dir', help='on-disk profile for the lean browser (default: a fresh temporary one)')
+    args = parser.parse_args()
+
+    # keep the spans of this run out of the checkout's metrics directory
+    os.environ.setdefault('METRICS_SPANS_FILE', os.path.join(tempfile.mkdtemp(prefix='perfumebot-pageload-'), 'spans.jsonl'))
+
+    vendor = run_vendor(latency=args.latency, asset_latency=args.asset_latency)
+    results = {}
+    try:
+        results['default'] = time_pages(vendor, False, args.loads)
+        results['lean'] = time_pages(vendor, True, args.loads, args.profile_dir)
+    finally:
+        vendor.shutdown()
+
+    print(f"\n{args.loads} load(s) per page, page latency {args.latency}s, asset latency {args.asset_latency}s")
+    print(f"{'page':10s} {'default p50':>12s} {'lean p50':>10s} {'default p90':>12s} {'lean p90':>10s} {'speedup':>8s}")
+    for page in PAGES:
+        default, lean = results['default'][0][page], results['lean'][0][page]
+        print(f"{page:10s} {statistics.median(default):11.3f}s {statistics.median(lean):9.3f}s "
+              f"{p90(default):11.3f}s {p90(lean):9.3f}s {statistics.median(default) / statistics.median(lean):7.1f}x")
+    print(f"asset requests: default {results['default'][1]}, lean {results['lean'][1]}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Benchmark the tracking export column filter on a synthetic export.
+
+    python benchmarks/bench_tracking_csv.py [--rows 500000]
+
+Compares the original full pandas round-trip against the pandas usecols mode and the
+chunked stream mode (stdlib csv and, if installed, pyarrow), and checks that every mode
+writes exactly the same bytes as the original.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pandas as pd
+from utils import tracking_csv
+from utils.tracking_csv import TRACKING_COLUMNS_TO_REMOVE, filter_tracking_csv, keep_tracking_column
+
+HEADER = [
+    "Order ID", "PO Number", "First Name", "Last Name", "Address 1", "Address 2",
+    "City", "State", "Zip", "SKU", "Pcs", "Unit Price", "Shipping Cost",
+    "Carrier", "Service", "Tracking Number", "Ship Date", "Order Date",
+]
+
+def write_synthetic_export(path, rows):
+    rng = random.Random(42)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        f.write(','.join(HEADER) + '\n')
+        for i in range(rows):
+            order_id = 1000000 + i
+            f.write(','.join([
+                str(order_id),
+                f"#{500000 + i}",
+                rng.choice(['Ann', 'Bob', 'Carla', 'Dev']),
+                rng.choice(['Smith', 'Lee', 'Garcia', "O'Neil"]),
+                f"{rng.randint(1, 9999)} Main St",
+                rng.choice(['', 'Apt 2', 'Suite 400']),
+                rng.choice(['Boston', 'Austin', '"Portland, OR"']),
+                rng.choice(['MA', 'TX', 'OR']),
+                f"{rng.randint(1000, 99999):05d}",
+                f"SKU-{rng.randint(1, 5000)}",
+                str(rng.randint(1, 4)),
+                f"{rng.uniform(5, 150):.2f}",
+                f"{rng.uniform(0, 20):.2f}",
+                rng.choice(['UPS', 'USPS', 'FedEx']),
+                rng.choice(['Ground', 'Priority', '2Day']),
+                f"1Z{rng.randint(10**15, 10**16 - 1)}",
+                f"2025-06-{rng.randint(1, 28):02d}",
+                f"2025-05-{rng.randint(1, 28):02d}",
+            ]) + '\n')
+
+def original(src, dst):
+    # what process_csv_file() did before: parse everything, drop, write
+    df = pd.read_csv(src)
+    df.drop(columns=[col for col in TRACKING_COLUMNS_TO_REMOVE if col in df.columns], inplace=True)
+    df.to_csv(dst, index=False)
+
+def pandas_usecols(src, dst):
+    df = pd.read_csv(src, usecols=keep_tracking_column)
+    df.to_csv(dst, index=False)
+
+def stream(src, dst):
+    with open(dst, 'wb') as f:
+        filter_tracking_csv(src, f)
+
+def stream_stdlib(src, dst):
+    # force the stdlib parser even when pyarrow is installed
+    saved, tracking_csv.pa_csv = tracking_csv.pa_csv, None
+    try:
+        stream(src, dst)
+    finally:
+        tracking_csv.pa_csv = saved
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=500000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, 'export.csv')
+        write_synthetic_export(src, args.rows)
+        print(f"synthetic export: {args.rows} rows, {os.path.getsize(src) / 1e6:.1f} MB")
+
+        modes = [('original', original), ('pandas usecols', pandas_usecols), ('stream (stdlib csv)', stream_stdlib)]
+        if tracking_csv.pa_csv is not None:
+            modes.append(('stream (pyarrow)', stream))
+
+        outputs = {}
+        for name, func in modes:
+            dst = os.path.join(tmp, f"{name.split()[0]}-{len(outputs)}.csv")
+            start = time.perf_counter()
+            func(src, dst)
+            elapsed = time.perf_counter() - start
+            with open(dst, 'rb') as f:
+                outputs[name] = f.read()
+            identical = outputs[name] == outputs['original']
+            print(f"{name:22s} {elapsed:7.2f}s  identical to original: {identical}")
+
+if __name__ == '__main__':
+    main()
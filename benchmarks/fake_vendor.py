@@ -0,0 +1,324 @@
+"""Local stand-ins for the vendor site and the FTP server, for benchmarks/bench_e2e.py.
+
+FakeVendor serves just the pages and element ids the bot relies on:
+    /login              user / pw / #submitBtn, then "Welcome, Gabrielle"
+    /upload             #formFile + #uploadBtn -> optional .proceedBtn -> #submitBtn -> .mb-0 "#<batch>"
+    /orders             #csvBtn -> .swal2-confirm popup -> /orders/export.csv (4101_tps_tracking.csv)
+    /inventory/login    login_email / login_pass
+    /inventory/feed.csv with an ETag, only with the cookie from /inventory/login
+Every request waits `latency` seconds first, and submits wait `submit_latency` on top.
+With asset_latency set, every page also pulls in a stylesheet, a web font, two images and an
+analytics script from /static, each taking asset_latency seconds, like the real site's pages.
+
+run_ftp_server() starts pyftpdlib (benchmarks/requirements.txt) on a temp directory
+with the /out/orders, /out/orders/archive, /in/inventory and /in/fulfillments layout.
+"""
+import io
+import os
+import csv
+import json
+import time
+import random
+import secrets
+import hashlib
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+USERNAME = 'bench@example.com'
+PASSWORD = 'bench-password'
+
+PAGE = '<!doctype html><html><head><title>{title}</title>{assets}</head><body>{body}</body></html>'
+
+ASSETS = '''
+<link rel="stylesheet" href="/static/site.css">
+<script src="/static/analytics.js"></script>
+<img src="/static/logo.png" alt=""><img src="/static/banner.jpg" alt="">'''
+
+STATIC = {
+    'site.css': ('text/css', b'@font-face { font-family: Brand; src: url(/static/brand.woff2); } body { font-family: Brand, sans-serif; }'),
+    'brand.woff2': ('font/woff2', bytes(40_000)),
+    'logo.png': ('image/png', bytes(20_000)),
+    'banner.jpg': ('image/jpeg', bytes(250_000)),
+    'analytics.js': ('application/javascript', b'window.dataLayer = window.dataLayer || [];'),
+}
+
+LOGIN_BODY = '''
+<form method="post" action="/login">
+  <input name="user" type="text"><input name="pw" type="password">
+  <button id="submitBtn" type="submit">Log in</button>
+</form>'''
+
+UPLOAD_BODY = '''
+<form method="post" action="/upload" enctype="multipart/form-data">
+  <input id="formFile" name="formFile" type="file">
+  <button id="uploadBtn" type="submit">Upload</button>
+</form>'''
+
+PROCEED_BODY = '''
+<p>Some addresses could not be verified.</p>
+<form method="post" action="/proceed">
+  <input type="hidden" name="upload" value="{upload_id}">
+  <button class="proceedBtn" type="submit">Proceed anyway</button>
+</form>'''
+
+SUBMIT_BODY = '''
+<p>{rows} order line(s) ready.</p>
+<form method="post" action="/submit">
+  <input type="hidden" name="upload" value="{upload_id}">
+  <button id="submitBtn" type="submit">Submit order</button>
+</form>'''
+
+ORDERS_BODY = '''
+<button id="csvBtn" onclick="document.getElementById('popup').style.display='block'">Download CSV</button>
+<div id="popup" style="display:none">
+  <button class="swal2-confirm swal2-styled" onclick="window.location='/orders/export.csv?status=2'">Download</button>
+</div>'''
+
+TRACKING_HEADER = [
+    "Order ID", "PO Number", "First Name", "Last Name", "Address 1", "Address 2",
+    "City", "State", "Zip", "SKU", "Pcs", "Unit Price", "Shipping Cost",
+    "Carrier", "Service", "Tracking Number", "Ship Date", "Order Date",
+]
+
+class VendorState:
+    def __init__(self, tracking_rows=1000, inventory_rows=5000, address_prompt_rate=0.0):
+        self.lock = threading.Lock()
+        self.sessions = set()
+        self.inventory_sessions = set()
+        self.logins = {'site': 0, 'inventory': 0}
+        self.uploads = {}   # upload id -> (file name, rows)
+        self.batches = {}   # batch number -> (file name, rows)
+        self.next_batch = 100000
+        self.requests = 0
+        self.asset_requests = 0
+        self.address_prompt_rate = address_prompt_rate
+        self.random = random.Random(7)
+        self.tracking_csv = self._tracking_csv(tracking_rows)
+        self.inventory_csv = self._inventory_csv(inventory_rows)
+        self.inventory_etag = '"' + hashlib.sha256(self.inventory_csv).hexdigest()[:16] + '"'
+
+    def _tracking_csv(self, rows):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(TRACKING_HEADER)
+        for i in range(rows):
+            writer.writerow([
+                1000000 + i, f"#{500000 + i}", 'Ann', 'Smith', '1 Main St', '', 'Boston', 'MA', '02110',
+                f"SKU-{i % 500}", 1, '10.00', '0.00', 'UPS', 'Ground', f"1Z{900000000 + i}", '2025-06-01', '2025-05-30',
+            ])
+        return out.getvalue().encode()
+
+    def _inventory_csv(self, rows):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(['SKU', 'Title', 'Qty', 'Price'])
+        for i in range(rows):
+            writer.writerow([f"SKU-{i}", f"Perfume {i}", i % 40, f"{10 + i % 90}.00"])
+        return out.getvalue().encode()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'asset_requests': self.asset_requests,
+                'logins': dict(self.logins),
+                'batches': len(self.batches),
+                'order_rows': sum(rows for _, rows in self.batches.values()),
+                'files': sorted(name for name, _ in self.batches.values()),
+            }
+
+class VendorHandler(BaseHTTPRequestHandler):
+    server_version = 'FakeVendor/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass  # keep the benchmark output readable
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _send(self, status=200, body=b'', content_type='text/html; charset=utf-8', headers=None, head=False):
+        if isinstance(body, str):
+            body = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def _page(self, title, body, **kwargs):
+        assets = ASSETS if self.server.asset_latency is not None else ''
+        self._send(body=PAGE.format(title=title, assets=assets, body=body), **kwargs)
+
+    def _redirect(self, location, headers=None):
+        self._send(303, headers={'Location': location, **(headers or {})})
+
+    def _cookies(self):
+        cookies = {}
+        for part in self.headers.get('Cookie', '').split(';'):
+            if '=' in part:
+                name, value = part.strip().split('=', 1)
+                cookies[name] = value
+        return cookies
+
+    def _logged_in(self):
+        return self._cookies().get('sid') in self.state.sessions
+
+    def _form(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length)
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('multipart/form-data'):
+            message = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {content_type}\r\n\r\n".encode() + raw
+            )
+            fields, files = {}, {}
+            for part in message.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                if part.get_filename():
+                    files[name] = (part.get_filename(), part.get_payload(decode=True))
+                else:
+                    fields[name] = part.get_content()
+            return fields, files
+        return {k: v[0] for k, v in parse_qs(raw.decode()).items()}, {}
+
+    def _wait(self, extra=0.0):
+        with self.state.lock:
+            self.state.requests += 1
+        time.sleep(self.server.latency + extra)
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        url = urlparse(self.path)
+        if url.path.startswith('/static/') and url.path[len('/static/'):] in STATIC:
+            with self.state.lock:
+                self.state.asset_requests += 1
+            time.sleep(self.server.asset_latency or 0.0)
+            content_type, body = STATIC[url.path[len('/static/'):]]
+            return self._send(body=body, content_type=content_type, head=head, headers={'Cache-Control': 'max-age=3600'})
+        self._wait()
+        if url.path == '/login':
+            return self._page('Login', LOGIN_BODY, head=head)
+        if url.path == '/dashboard':
+            if not self._logged_in():
+                return self._redirect('/login')
+            return self._page('Dashboard', '<h1>Welcome, Gabrielle</h1>', head=head)
+        if url.path == '/upload':
+            if not self._logged_in():
+                return self._page('Login', LOGIN_BODY, head=head)
+            return self._page('Upload', UPLOAD_BODY, head=head)
+        if url.path == '/orders':
+            if not self._logged_in():
+                return self._page('Login', LOGIN_BODY, head=head)
+            return self._page('Orders', ORDERS_BODY, head=head)
+        if url.path == '/orders/export.csv':
+            if not self._logged_in():
+                return self._page('Login', LOGIN_BODY, head=head)
+            return self._send(body=self.state.tracking_csv, content_type='text/csv', head=head, headers={
+                'Content-Disposition': 'attachment; filename="4101_tps_tracking.csv"',
+            })
+        if url.path == '/inventory/feed.csv':
+            if self._cookies().get('inv') not in self.state.inventory_sessions:
+                return self._redirect('/inventory/login')
+            etag = self.state.inventory_etag
+            if self.headers.get('If-None-Match') == etag:
+                return self._send(304, headers={'ETag': etag}, head=True)
+            return self._send(body=self.state.inventory_csv, content_type='text/csv', head=head, headers={'ETag': etag})
+        if url.path == '/_stats':
+            return self._send(body=json.dumps(self.state.stats()), content_type='application/json', head=head)
+        self._send(404, 'not found', head=head)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        self._wait(self.server.submit_latency if url.path == '/submit' else 0.0)
+        fields, files = self._form()
+
+        if url.path == '/login':
+            if fields.get('user') != USERNAME or fields.get('pw') != PASSWORD:
+                return self._page('Login', '<p>Wrong password</p>' + LOGIN_BODY)
+            sid = secrets.token_hex(16)
+            with self.state.lock:
+                self.state.sessions.add(sid)
+                self.state.logins['site'] += 1
+            return self._redirect('/dashboard', {'Set-Cookie': f'sid={sid}; Path=/'})
+        if url.path == '/inventory/login':
+            token = secrets.token_hex(8)
+            with self.state.lock:
+                self.state.inventory_sessions.add(token)
+                self.state.logins['inventory'] += 1
+            return self._send(body='ok', headers={'Set-Cookie': f'inv={token}; Path=/'})
+
+        if not self._logged_in():
+            return self._page('Login', LOGIN_BODY)
+
+        if url.path == '/upload':
+            if 'formFile' not in files:
+                return self._page('Upload', '<p>No file</p>' + UPLOAD_BODY)
+            file_name, content = files['formFile']
+            rows = max(0, len(content.decode('utf-8-sig').strip().splitlines()) - 1)
+            upload_id = secrets.token_hex(8)
+            with self.state.lock:
+                self.state.uploads[upload_id] = (file_name, rows)
+                prompt = self.state.random.random() < self.state.address_prompt_rate
+            if prompt:
+                return self._page('Verify', PROCEED_BODY.format(upload_id=upload_id))
+            return self._page('Review', SUBMIT_BODY.format(upload_id=upload_id, rows=rows))
+        if url.path == '/proceed':
+            upload_id = fields.get('upload')
+            rows = self.state.uploads.get(upload_id, ('', 0))[1]
+            return self._page('Review', SUBMIT_BODY.format(upload_id=upload_id, rows=rows))
+        if url.path == '/submit':
+            with self.state.lock:
+                upload = self.state.uploads.pop(fields.get('upload'), None)
+                if upload is None:
+                    return self._page('Error', '<p class="mb-0">Upload not found</p>')
+                batch = self.state.next_batch
+                self.state.next_batch += 1
+                self.state.batches[batch] = upload
+            return self._page('Done', f'<div class="alert"><p class="mb-0">Batch #{batch} created with {upload[1]} order line(s)</p></div>')
+        self._send(404, 'not found')
+
+def run_vendor(latency=0.0, submit_latency=0.0, asset_latency=None, **state_options):
+    """start the fake vendor on a free localhost port in a background thread. returns the server"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), VendorHandler)
+    server.daemon_threads = True
+    server.state = VendorState(**state_options)
+    server.latency = latency
+    server.submit_latency = submit_latency
+    server.asset_latency = asset_latency
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, name='fake-vendor', daemon=True).start()
+    return server
+
+def run_ftp_server(root, user='bench', password='bench', latency=0.0):
+    """start pyftpdlib on a free localhost port in a background thread. returns (server, port)"""
+    from pyftpdlib.authorizers import DummyAuthorizer
+    from pyftpdlib.handlers import FTPHandler
+    from pyftpdlib.servers import ThreadedFTPServer
+
+    for directory in ('out/orders/archive', 'in/inventory', 'in/fulfillments'):
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+
+    class SlowHandler(FTPHandler):
+        def pre_process_command(self, line, cmd, arg):
+            time.sleep(latency)
+            return super().pre_process_command(line, cmd, arg)
+
+    authorizer = DummyAuthorizer()
+    authorizer.add_user(user, password, root, perm='elradfmwMT')
+    handler = SlowHandler if latency else FTPHandler
+    handler.authorizer = authorizer
+    handler.banner = 'fake ftp ready'
+
+    server = ThreadedFTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, kwargs={'handle_exit': False}, name='fake-ftp', daemon=True).start()
+    return server, server.address[1]
@@ -1,16 +1,29 @@
 import os
+import sys
+import time
+import logging
 from dotenv import load_dotenv
-from upload_orders import upload_order
+from order_batching import ORDER_COALESCE, coalesce_order_files, record_merged_upload
+from order_pipeline import ORDER_PIPELINE
+from order_validation import screen_order_files
 from move_local_files import move_files_to_processed
-from scrape_inventory import scrape_inventory
-from scrape_tracking import scrape_tracking
-from utils.selenium_login import perfume_selenium_login, logger
-from utils.ftp_utils import connect_ftp, download_files, archive_files_on_ftp
-from utils.selenium_setup import get_headless_driver
-from utils.email_utils import send_email
+from utils.ftp_utils import ftp_pool, FTPTransferError, download_files, archive_files_on_ftp, REMOTE_ORDERS_DIR
+from utils import order_ledger
+from utils.selenium_session import SeleniumSession
+from utils.run_state import RUN_STATE_FILE, load_state, save_state
+from utils.metrics import write_textfile
+
+# selenium, pandas, requests and the email stack are imported inside the stages that use them,
+# so a run with nothing to do never pays for them
 
 load_dotenv()
 
+logger = logging.getLogger('main')
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+
 # website login credentials
 LOGIN_USERNAME = os.getenv('LOGIN_USERNAME')
 LOGIN_PASSWORD = os.getenv('LOGIN_PASSWORD')
@@ -19,92 +32,270 @@ LOGIN_PASSWORD = os.getenv('LOGIN_PASSWORD')
 LOCAL_ORDERS_DIR = os.getenv('LOCAL_ORDERS_DIR')
 LOCAL_PROCESSED_DIR = os.getenv('LOCAL_PROCESSED_DIR')
 
+# --daemon schedules, in seconds
+ORDERS_INTERVAL = int(os.getenv('ORDERS_INTERVAL', 300))
+TRACKING_INTERVAL = int(os.getenv('TRACKING_INTERVAL', 3600))
+INVENTORY_CHECK_INTERVAL = int(os.getenv('INVENTORY_CHECK_INTERVAL', 300)) # only downloads when the ETag changed
+
+# per-stage limits for a normal run, in seconds
+ORDERS_STAGE_TIMEOUT = int(os.getenv('ORDERS_STAGE_TIMEOUT', 1800))
+INVENTORY_STAGE_TIMEOUT = int(os.getenv('INVENTORY_STAGE_TIMEOUT', 600))
+TRACKING_STAGE_TIMEOUT = int(os.getenv('TRACKING_STAGE_TIMEOUT', 900))
+
 upload_orders_success = False
+uploaded_order_files = {} # order file -> batch number, for the summary email
 
-def upload_orders():
-    global upload_orders_success
-    batch_numbers = []
-    
-    # 1. connect to FTP & download files
-    ftp = connect_ftp()
+def _record_archived(file_name):
+    order_ledger.record_archived([file_name])
+
+def download_order_files():
+    """download + archive every order file up front. returns {upload file: [order files]}"""
+    # 1. download files from FTP on the run's shared connection pool
     downloaded_files = []
-    if ftp:
+    try:
+        downloaded_files = ftp_pool.run(download_files)  # download files from FTP
+        for file_name in downloaded_files:
+            order_ledger.record_downloaded(file_name, os.path.join(LOCAL_ORDERS_DIR, file_name), f"{REMOTE_ORDERS_DIR}/{file_name}")
+        if downloaded_files:
+            # archive downloaded files from FTP, each marked 'archived' in the ledger as soon as it has moved
+            ftp_pool.run(archive_files_on_ftp, downloaded_files, on_archived=_record_archived)
+    except FTPTransferError as e:
+        from utils.email_utils import send_email
+        # files archived before the failure are already 'archived' in the ledger and resume_orders()
+        # picks them up below. the rest are still in /out/orders and come down again next run
+        logger.error(f"FTP order download failed: {e}")
+        send_email('FTP order download failed', str(e))
+        downloaded_files = []
+
+    # what's left to upload comes from the ledger: new files plus anything an earlier run archived but never sent
+    pending_files = resume_orders()
+
+    # 2. optionally merge compatible order files so they go up as one vendor batch
+    uploads = {file_name: [file_name] for file_name in pending_files}
+    if ORDER_COALESCE and pending_files:
         try:
-            downloaded_files = download_files(ftp)  # download files from FTP
-            if downloaded_files:
-                archive_files_on_ftp(ftp, downloaded_files)  # archive downloaded files from FTP
-        finally:
-            ftp.quit()
-            logger.info("FTP connection closed")
+            uploads = coalesce_order_files(pending_files)
+        except Exception as e:
+            logger.error(f"failed to merge order files, uploading them one by one: {e}", exc_info=True)
+        for upload_file, source_files in uploads.items():
+            if upload_file not in source_files:
+                order_ledger.assign_upload(upload_file, source_files)
+    return uploads
 
-    # if no files are downloaded --quit
-    if not downloaded_files:
-        logger.info("no files downloaded. nothing to do. byeee!")
-        return #quit main() if no files found
+def resume_orders():
+    """finish what an earlier run left in the orders dir and return the files still to upload"""
+    global upload_orders_success
+    pending_files, submitted, held = order_ledger.recover(LOCAL_ORDERS_DIR)
 
-    # 2. login to PerfumeShop
-    driver = get_headless_driver()
-    try:
-        logged_in = perfume_selenium_login(driver, LOGIN_USERNAME, LOGIN_PASSWORD)
-        if not logged_in:
-            logger.error("login failed --qutting main script.")
-            driver.quit()
-            return None #quit main() if login fails
+    if submitted:
+        # the vendor already has these batches -- only the move to 'processed' didn't happen
+        move_files_to_processed(LOCAL_ORDERS_DIR, LOCAL_PROCESSED_DIR, list(submitted))
+        order_ledger.record_moved(list(submitted))
+        uploaded_order_files.update(submitted)
+        upload_orders_success = True
+    if held:
+        from utils.email_utils import send_email
+        send_email(
+            'perfumebot order upload interrupted',
+            f"a previous run stopped while uploading {', '.join(held)}. check the vendor site, then run "
+            "'python -m utils.order_ledger done FILE BATCH' if it went through or 'python -m utils.order_ledger retry FILE' if not.",
+        )
+    # a malformed file is quarantined here instead of failing on the vendor site every run
+    return screen_order_files(pending_files)
 
-        # 3. process each order file individually
-        for file_name in downloaded_files:
-            file_path = os.path.join(LOCAL_ORDERS_DIR, file_name) # get file path of order to upload
-            logger.info(f"starting upload for file: {file_name}")
+def send_upload_failure(send_email, source_files):
+    ledger_rows = [order_ledger.get_order(file_name) or {} for file_name in source_files]
+    if all(row.get('state') == order_ledger.ARCHIVED for row in ledger_rows):
+        logger.warning(f"failed to upload {source_files} before submitting. leaving them in the orders directory to retry next run")
+        send_email('perfumebot failed to upload order', f"failed to upload {', '.join(source_files)} before submitting it. "
+                   "it never reached the vendor and will be retried on the next run.")
+        return
+
+    logger.error(f"upload of {source_files} was submitted but not confirmed. holding them until checked")
+    send_email(
+        'perfumebot failed to upload order',
+        f"{', '.join(source_files)} may or may not have reached the vendor: the order was submitted but no batch "
+        "number was confirmed. it won't be retried automatically. check the vendor site, then run\n\n"
+        + '\n'.join(f"  python -m utils.order_ledger done {file_name} BATCH   (it went through as BATCH)\n"
+                     f"  python -m utils.order_ledger retry {file_name}        (it didn't)" for file_name in source_files),
+    )
+
+def upload_orders(session):
+    global upload_orders_success
+    batch_numbers = []
+    
+    if ORDER_PIPELINE and not ORDER_COALESCE:
+        # download, archive and upload overlap: the first order goes up while the rest are still coming down
+        from order_pipeline import pipeline_order_uploads
+        uploads = None
+        results = pipeline_order_uploads(session, resume_orders())
+    else:
+        uploads = download_order_files()
+        # if no files are downloaded --quit
+        if not uploads:
+            logger.info("no files downloaded. nothing to do. byeee!")
+            return #quit main() if no files found
 
-            success, batch_number = upload_order(driver, file_path) # call the upload_order function from upload_orders.py
+        # 3. login to PerfumeShop & process each upload file (one or more browsers, see ORDER_UPLOAD_WORKERS)
+        from upload_workers import upload_order_files
+        results = upload_order_files(session, list(uploads))
+
+    from utils.email_utils import send_email
+    try:
+        for upload_file, success, batch_number in results:
+            source_files = uploads[upload_file] if uploads else [upload_file]
             if success:
                 if batch_number:
                     batch_numbers.append(batch_number)
-                    logger.info(f"successfully uploaded {file_name} from batch number: {batch_number}. Moving order file to the 'processed' directory.")
-                # 4 move this single order file to 'processed' dir
-                move_files_to_processed(LOCAL_ORDERS_DIR, LOCAL_PROCESSED_DIR, [file_name])
+                    logger.info(f"successfully uploaded {source_files} from batch number: {batch_number}. Moving order file(s) to the 'processed' directory.")
+                # 4. move the order file(s) behind this upload to 'processed' dir
+                move_files_to_processed(LOCAL_ORDERS_DIR, LOCAL_PROCESSED_DIR, source_files)
+                order_ledger.record_moved(source_files)
+                uploaded_order_files.update({file_name: batch_number for file_name in source_files})
                 upload_orders_success = True
             else:
-                error_message = f"failed to upload {file_name}"
-                logger.warning(f'failed to upload {file_name}, leaving it in orders directory.')
-                send_email('perfumebot failed to upload order', error_message)
-            
-            driver.get(os.getenv('UPLOAD_URL')) #5 reset to upload page for next order
+                send_upload_failure(send_email, source_files)
+
+            if upload_file not in source_files:
+                record_merged_upload(upload_file, batch_number if success else None)
         
         return batch_numbers if batch_numbers else None
 
     except Exception as e:
-        logger.error(f"selenium login failed: {e}", exc_info=True)
-    finally:
-        logger.info("quitting browser")
-        driver.quit()
-        logger.info("browser closed")
+        logger.error(f"order upload failed: {e}", exc_info=True)
 
 def scrape_inventory_to_ftp():
+    from scrape_inventory import scrape_inventory
     try:
         scraped_and_uploaded_inventory = scrape_inventory()
         if scraped_and_uploaded_inventory:
             logger.info('inventory file successfully downloaded from vendor and uploaded to FTP')
+        return bool(scraped_and_uploaded_inventory)
     except Exception as e:
-        logger.error(f"failed to upload inventory to FTP: {e}", exc=True)
+        logger.error(f"failed to upload inventory to FTP: {e}", exc_info=True)
+        return False
 
-def scrape_tracking_to_ftp():
+def scrape_tracking_to_ftp(session, started=None):
+    """started is when the run began (default now). tracking runs after orders in the browser lane, so
+    timing --precheck's TRACKING_MIN_INTERVAL from when it finished would skip it after a slow orders stage"""
+    from scrape_tracking import scrape_tracking
+    started = started or time.time()
     try:
-        scraped_and_uploaded_tracking = scrape_tracking()
+        scraped_and_uploaded_tracking = scrape_tracking(session)
         if scraped_and_uploaded_tracking:
             logger.info('tracking file successfully downloaded from site and uploaded to FTP')
+            # lets --precheck know when tracking is due again
+            run_state = load_state(RUN_STATE_FILE)
+            run_state['tracking_last_success'] = started
+            save_state(run_state, RUN_STATE_FILE)
+        return bool(scraped_and_uploaded_tracking)
     except Exception as e:
         logger.error(f"failed to upload tracking to FTP: {e}", exc_info=True)
+        return False
 
 
-if __name__ == '__main__':
-    batch_numbers = upload_orders()
-    scrape_inventory_to_ftp()
-    scrape_tracking_to_ftp()
-
-    # check if all functions completed successfully and if so, send an email
+def send_order_summary(run_summary=None):
+    # check if the order upload completed successfully and if so, send an email
     if upload_orders_success:
+        from utils.email_utils import send_email
+        from utils.orchestrator import format_run_summary
+        batch_numbers = list(dict.fromkeys(batch for batch in uploaded_order_files.values() if batch))
         batch_numbers_str = ', '.join(batch_numbers) if batch_numbers else 'no batch numbers'
         success_message = f"PerfumeSpotBot completed successfully. Processed batches: {batch_numbers_str}"
-        send_email("PerfumeSpotBot Order Summary", success_message)
-        logger.info("order submission success email sent.")  
\ No newline at end of file
+        order_lines = [f"{file_name}: batch {batch_number or 'unknown'}" for file_name, batch_number in uploaded_order_files.items()]
+        success_message += "\n\n" + "\n".join(order_lines)
+        if run_summary:
+            success_message += "\n\nRun summary:\n" + format_run_summary(run_summary)
+        send_email("PerfumeSpotBot Order Summary", success_message, digest=False)
+        logger.info("order submission success email sent.")
+
+def flush_notifications(close=False):
+    # only if a stage actually pulled in the email stack
+    email_utils = sys.modules.get('utils.email_utils')
+    if email_utils:
+        email_utils.flush_emails(close=close)
+
+def run_orders(session, send_summary=True):
+    global upload_orders_success
+    upload_orders_success = False
+    uploaded_order_files.clear()
+
+    upload_orders(session)
+    if send_summary:
+        send_order_summary()
+    return True
+
+def run_daemon():
+    """keep running with one schedule per job, reusing the browser and FTP connections between runs"""
+    import threading
+    from utils.scheduler import Scheduler
+    from utils.precheck import inventory_changed
+
+    session = SeleniumSession(LOGIN_USERNAME, LOGIN_PASSWORD)
+    browser_lock = threading.Lock()  # orders and tracking share the one browser
+
+    def browser_job(func):
+        def job():
+            session.invalidate()  # re-check the login, the vendor may have expired it since last time
+            try:
+                func(session)
+            finally:
+                flush_notifications()  # one digest per job; the SMTP connection stays open for the next one
+        return job
+
+    def inventory_job():
+        try:
+            if inventory_changed():
+                scrape_inventory_to_ftp()
+            else:
+                logger.info("inventory feed unchanged. nothing to do")
+        finally:
+            flush_notifications()
+
+    scheduler = Scheduler()
+    scheduler.add_job('orders', ORDERS_INTERVAL, browser_job(run_orders), lock=browser_lock)
+    scheduler.add_job('tracking', TRACKING_INTERVAL, browser_job(scrape_tracking_to_ftp), lock=browser_lock)
+    scheduler.add_job('inventory', INVENTORY_CHECK_INTERVAL, inventory_job)
+    try:
+        scheduler.run_forever()
+    finally:
+        session.close()
+        ftp_pool.close()
+        flush_notifications(close=True)
+
+if __name__ == '__main__':
+    if '--daemon' in sys.argv:
+        run_daemon()
+        sys.exit(0)
+
+    run_started = time.time()
+    # --precheck: quick look at FTP / the inventory ETag / the tracking schedule, and only run what has work
+    work = {'orders': True, 'inventory': True, 'tracking': True}
+    if '--precheck' in sys.argv:
+        from utils.precheck import precheck
+        work = precheck()
+        if not any(work.values()):
+            ftp_pool.close()
+            write_textfile()
+            logger.info("precheck: nothing to do. byeee!")
+            sys.exit(0)
+
+    from utils.orchestrator import run_lanes, format_run_summary
+
+    # one browser + login shared by the order upload and tracking stages, so they run one after
+    # the other in the same lane. inventory is only requests + FTP and runs alongside them.
+    with SeleniumSession(LOGIN_USERNAME, LOGIN_PASSWORD) as session:
+        browser_lane = []
+        if work['orders']:
+            browser_lane.append(('orders', lambda: run_orders(session, send_summary=False), ORDERS_STAGE_TIMEOUT))
+        if work['tracking']:
+            browser_lane.append(('tracking', lambda: scrape_tracking_to_ftp(session, run_started), TRACKING_STAGE_TIMEOUT))
+        inventory_lane = [('inventory', scrape_inventory_to_ftp, INVENTORY_STAGE_TIMEOUT)] if work['inventory'] else []
+
+        run_summary = run_lanes([browser_lane, inventory_lane])
+    ftp_pool.close()
+
+    logger.info("run summary:\n" + format_run_summary(run_summary))
+    send_order_summary(run_summary)
+    flush_notifications(close=True)
+    write_textfile()
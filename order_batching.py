@@ -0,0 +1,127 @@
+import os
+import csv
+import json
+import time
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+
+LOCAL_ORDERS_DIR = os.getenv('LOCAL_ORDERS_DIR')
+
+# merge all pending order files with the same header into as few uploads as possible
+ORDER_COALESCE = os.getenv('ORDER_COALESCE', 'false').lower() in ('1', 'true', 'yes')
+ORDER_BATCH_MAX_ROWS = int(os.getenv('ORDER_BATCH_MAX_ROWS', 500))
+ORDER_BATCH_MAX_BYTES = int(os.getenv('ORDER_BATCH_MAX_BYTES', 1024 * 1024))
+
+MERGED_DIR_NAME = 'merged'
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_MAX_ENTRIES = 500
+
+def _merged_dir(orders_dir):
+    return os.path.join(orders_dir, MERGED_DIR_NAME)
+
+def _read_order_file(file_path):
+    with open(file_path, newline='', encoding='utf-8-sig') as f:
+        rows = [row for row in csv.reader(f) if row]
+    if not rows:
+        return None, []
+    header = [col.strip() for col in rows[0]]
+    return header, rows[1:]
+
+def load_manifest(orders_dir=LOCAL_ORDERS_DIR):
+    manifest_path = os.path.join(_merged_dir(orders_dir), MANIFEST_NAME)
+    if not os.path.isfile(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def _save_manifest(manifest, orders_dir):
+    # keep only the most recent merges so the file doesn't grow forever
+    if len(manifest) > MANIFEST_MAX_ENTRIES:
+        newest = sorted(manifest, key=lambda name: manifest[name]['created'])[-MANIFEST_MAX_ENTRIES:]
+        manifest = {name: manifest[name] for name in newest}
+
+    manifest_path = os.path.join(_merged_dir(orders_dir), MANIFEST_NAME)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def _write_merged_file(orders_dir, header, rows, sources, manifest):
+    merged_name = f"merged_{time.strftime('%Y%m%d-%H%M%S')}_{len(manifest)}.csv"
+    upload_file = os.path.join(MERGED_DIR_NAME, merged_name)
+
+    with open(os.path.join(orders_dir, upload_file), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+    manifest[upload_file] = {'sources': sources, 'batch_number': None, 'created': time.time()}
+    logger.info(f"merged {len(sources)} order file(s) ({len(rows)} rows) into {upload_file}: {sources}")
+    return upload_file
+
+def coalesce_order_files(file_names, orders_dir=LOCAL_ORDERS_DIR, max_rows=ORDER_BATCH_MAX_ROWS, max_bytes=ORDER_BATCH_MAX_BYTES):
+    """merge order files that share a header into upload files of at most max_rows/max_bytes.
+
+    returns {upload_file: [source files]}. upload_file is a path relative to orders_dir. a file that
+    can't be merged (unreadable, too big on its own, only one in its group) is uploaded as itself.
+    """
+    os.makedirs(_merged_dir(orders_dir), exist_ok=True)
+    manifest = load_manifest(orders_dir)
+    uploads = {}
+
+    # group files by header, keeping the download order
+    groups = {}
+    for file_name in file_names:
+        file_path = os.path.join(orders_dir, file_name)
+        try:
+            header, rows = _read_order_file(file_path)
+        except Exception as e:
+            logger.warning(f"could not read {file_name} for merging ({e}). uploading it on its own")
+            uploads[file_name] = [file_name]
+            continue
+
+        if header is None:
+            uploads[file_name] = [file_name]
+            continue
+        groups.setdefault(tuple(header), []).append((file_name, rows, os.path.getsize(file_path)))
+
+    for header, files in groups.items():
+        batch, batch_rows, batch_bytes = [], [], 0
+
+        def flush():
+            if len(batch) == 1:
+                uploads[batch[0]] = [batch[0]]
+            elif batch:
+                uploads[_write_merged_file(orders_dir, list(header), batch_rows, list(batch), manifest)] = list(batch)
+
+        for file_name, rows, size in files:
+            if batch and (len(batch_rows) + len(rows) > max_rows or batch_bytes + size > max_bytes):
+                flush()
+                batch, batch_rows, batch_bytes = [], [], 0
+            batch.append(file_name)
+            batch_rows.extend(rows)
+            batch_bytes += size
+        flush()
+
+    _save_manifest(manifest, orders_dir)
+    return uploads
+
+def record_merged_upload(upload_file, batch_number, orders_dir=LOCAL_ORDERS_DIR):
+    """store the vendor batch number for a merged upload and remove the merged file"""
+    manifest = load_manifest(orders_dir)
+    if upload_file in manifest:
+        manifest[upload_file]['batch_number'] = batch_number
+        _save_manifest(manifest, orders_dir)
+
+    merged_path = os.path.join(orders_dir, upload_file)
+    if os.path.dirname(upload_file) == MERGED_DIR_NAME and os.path.isfile(merged_path):
+        # the source files are still in the orders dir and, if this failed before the submit, get merged again next run
+        os.remove(merged_path)
@@ -0,0 +1,93 @@
+import os
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from move_local_files import move_files_to_processed
+from utils import order_ledger
+from order_validation import screen_order_files
+from utils.ftp_utils import (
+    ftp_pool, list_remote_files, download_order_file, archive_files_on_ftp,
+    REMOTE_ORDERS_DIR, LOCAL_ORDERS_DIR, LOCAL_PROCESSED_DIR, FTP_DOWNLOAD_CONNECTIONS,
+)
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+
+# start uploading as soon as the first order file lands instead of after every download + archive
+ORDER_PIPELINE = os.getenv('ORDER_PIPELINE', 'true').lower() in ('1', 'true', 'yes')
+# how many downloaded files may wait for an upload worker before the FTP side pauses
+ORDER_PIPELINE_DEPTH = int(os.getenv('ORDER_PIPELINE_DEPTH', 2))
+
+def _produce_order_file(file_name, size, mtime, file_queue):
+    ftp_pool.run(download_order_file, file_name, size, mtime)
+    state = order_ledger.record_downloaded(file_name, os.path.join(LOCAL_ORDERS_DIR, file_name), f"{REMOTE_ORDERS_DIR}/{file_name}")
+    ftp_pool.run(archive_files_on_ftp, [file_name])
+    order_ledger.record_archived([file_name])
+
+    if state in order_ledger.DONE_STATES:
+        # same content was already submitted -- only tidy it away
+        move_files_to_processed(LOCAL_ORDERS_DIR, LOCAL_PROCESSED_DIR, [file_name])
+        order_ledger.record_moved([file_name])
+    elif state in (order_ledger.FAILED, order_ledger.HELD):
+        logger.warning(f"{file_name} is {state} in the order ledger. not uploading it again")
+    elif screen_order_files([file_name]):
+        file_queue.put(file_name)  # blocks while the uploads are behind
+
+def _produce_order_files(remote_files, file_queue):
+    # FTP_DOWNLOAD_CONNECTIONS files come down (and get archived) at once; a failed one doesn't stop the rest
+    errors = []
+    try:
+        workers = max(1, min(FTP_DOWNLOAD_CONNECTIONS, ftp_pool.max_size, len(remote_files)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ftp-download') as executor:
+            futures = {
+                executor.submit(_produce_order_file, file_name, size, mtime, file_queue): file_name
+                for file_name, (size, mtime) in remote_files.items()
+            }
+            for future, file_name in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    # a file that wasn't archived isn't queued, so it can't be submitted twice
+                    logger.error(f"FTP order download failed for {file_name}: {e}")
+                    errors.append(f"{file_name}: {e}")
+    finally:
+        file_queue.put(None)
+        if errors:
+            from utils.email_utils import send_email
+            send_email('FTP order download failed', '\n'.join(errors))
+
+def pipeline_order_uploads(session, pending_files=(), workers=None):
+    """download+archive order files (FTP_DOWNLOAD_CONNECTIONS at a time) while the upload workers log in and start on
+    the first file. pending_files (already archived by an earlier run) are queued first.
+    yields (file_name, success, batch_number) like upload_order_files()."""
+    from upload_workers import upload_order_stream, ORDER_UPLOAD_WORKERS  # selenium/requests, only once there's work
+    workers = workers or ORDER_UPLOAD_WORKERS
+
+    try:
+        remote_files = ftp_pool.run(list_remote_files, REMOTE_ORDERS_DIR)
+    except Exception as e:
+        from utils.email_utils import send_email
+        logger.error(f"FTP order download failed: {e}")
+        send_email('FTP order download failed', str(e))
+        remote_files = {}
+    remote_files = {name: meta for name, meta in sorted(remote_files.items()) if name.endswith('.csv')}
+    logger.info(f"order files on FTP: {list(remote_files)}")
+    if not remote_files and not pending_files:
+        logger.info("no files downloaded. nothing to do. byeee!")
+        return
+
+    file_queue = queue.Queue(maxsize=ORDER_PIPELINE_DEPTH + len(pending_files))
+    for file_name in pending_files:
+        file_queue.put(file_name)
+    producer = threading.Thread(target=_produce_order_files, args=(remote_files, file_queue), name='order-producer', daemon=True)
+    producer.start()
+
+    yield from upload_order_stream(session, file_queue, min(workers, len(remote_files) + len(pending_files)))
+    producer.join()
@@ -0,0 +1,168 @@
+import io
+import os
+import re
+import csv
+import codecs
+import logging
+from dotenv import load_dotenv
+from utils import order_ledger
+from utils.metrics import span
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+
+LOCAL_ORDERS_DIR = os.getenv('LOCAL_ORDERS_DIR')
+LOCAL_PROCESSED_DIR = os.getenv('LOCAL_PROCESSED_DIR')
+
+# check every order file locally before it goes anywhere near the vendor site. by default only the
+# structure is checked (readable encoding, a header, the same number of fields on every row) -- the
+# column rules below are off until set, since the vendor's real schema isn't written down anywhere
+ORDER_VALIDATION = os.getenv('ORDER_VALIDATION', 'true').lower() in ('1', 'true', 'yes')
+# columns that must be in the header and filled in on every row, e.g. 'PO Number,SKU,Pcs'
+ORDER_REQUIRED_COLUMNS = [c.strip() for c in os.getenv('ORDER_REQUIRED_COLUMNS', '').split(',') if c.strip()]
+ORDER_SKU_COLUMN = os.getenv('ORDER_SKU_COLUMN', 'SKU')
+ORDER_SKU_PATTERN = re.compile(os.getenv('ORDER_SKU_PATTERN')) if os.getenv('ORDER_SKU_PATTERN') else None
+ORDER_QTY_COLUMN = os.getenv('ORDER_QTY_COLUMN', '') # quantity column to check, e.g. 'Pcs' (blank = not checked)
+ORDER_MAX_QTY = int(os.getenv('ORDER_MAX_QTY', 0)) # 0 = no upper limit
+# invalid files and their error reports go here instead of being uploaded
+ORDER_QUARANTINE_DIR = os.getenv('ORDER_QUARANTINE_DIR') or os.path.join(
+    os.path.dirname(os.path.normpath(LOCAL_PROCESSED_DIR or LOCAL_ORDERS_DIR or '.')), 'quarantine'
+)
+
+MAX_REPORTED_ERRORS = 50
+
+def _decode(data):
+    """text of an order file whatever excel saved it as: utf-8/utf-16 with or without a BOM, or windows-1252"""
+    for bom, encoding in ((codecs.BOM_UTF16_LE, 'utf-16-le'), (codecs.BOM_UTF16_BE, 'utf-16-be')):
+        if data.startswith(bom):
+            return data[len(bom):].decode(encoding)
+    if data.startswith(codecs.BOM_UTF8):
+        data = data[len(codecs.BOM_UTF8):]
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('cp1252')
+
+def _column(header, name):
+    wanted = name.strip().lower()
+    return next((i for i, col in enumerate(header) if col.lower() == wanted), None)
+
+def validate_order_rows(header, rows):
+    """return a list of problems with this header + rows (empty if the file is fine)"""
+    errors = []
+    if not any(header):
+        return ["header: the first row has no column names"]
+    lowered = [col.lower() for col in header]
+    duplicates = sorted({col for col in header if col and lowered.count(col.lower()) > 1})
+    if duplicates:
+        errors.append(f"header: duplicate column(s) {', '.join(duplicates)}")
+    missing = [col for col in ORDER_REQUIRED_COLUMNS if _column(header, col) is None]
+    if missing:
+        # nothing row-level makes sense without the columns
+        return errors + [f"header: missing column(s) {', '.join(missing)} (header is: {', '.join(header)})"]
+    if not rows:
+        return errors + ["file has no order rows"]
+
+    required = [(col, _column(header, col)) for col in ORDER_REQUIRED_COLUMNS]
+    sku_index = _column(header, ORDER_SKU_COLUMN) if ORDER_SKU_PATTERN else None
+    qty_index = _column(header, ORDER_QTY_COLUMN) if ORDER_QTY_COLUMN else None
+    for line, row in enumerate(rows, start=2):
+        if len(row) != len(header):
+            # usually an unquoted comma or a line break inside a cell -- the columns no longer line up
+            errors.append(f"row {line}: {len(row)} fields, the header has {len(header)}")
+            continue
+
+        empty = [col for col, index in required if not row[index]]
+        if empty:
+            errors.append(f"row {line}: {', '.join(empty)} {'is' if len(empty) == 1 else 'are'} empty")
+        sku = row[sku_index] if sku_index is not None else ''
+        if sku and not ORDER_SKU_PATTERN.fullmatch(sku):
+            errors.append(f"row {line}: SKU {sku!r} doesn't match ORDER_SKU_PATTERN")
+        qty = row[qty_index] if qty_index is not None else ''
+        if qty and (not qty.isdigit() or int(qty) < 1):
+            errors.append(f"row {line}: quantity {qty!r} is not a whole number of at least 1")
+        elif qty and ORDER_MAX_QTY and int(qty) > ORDER_MAX_QTY:
+            errors.append(f"row {line}: quantity {qty} is more than ORDER_MAX_QTY ({ORDER_MAX_QTY})")
+    return errors
+
+def check_order_file(file_path):
+    """validate an order file and, if it's fine, rewrite it as plain utf-8 with CRLF line endings and
+    trimmed cells (only when that changes anything). returns the list of problems"""
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    try:
+        rows = list(csv.reader(io.StringIO(_decode(data), newline='')))
+    except (csv.Error, UnicodeDecodeError) as e:
+        return [f"not a readable csv file: {e}"]
+
+    rows = [[cell.strip() for cell in row] for row in rows]
+    rows = [row for row in rows if any(row)]
+    if not rows:
+        return ["file is empty"]
+    header, rows = rows[0], rows[1:]
+    errors = validate_order_rows(header, rows)
+    if errors:
+        return errors
+
+    out = io.StringIO(newline='')
+    csv.writer(out).writerows([header] + rows)
+    normalized = out.getvalue().encode('utf-8')
+    if normalized != data:
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(normalized)
+        os.replace(tmp_path, file_path)
+        logger.info(f"normalized {os.path.basename(file_path)} (encoding, BOM, line endings or whitespace)")
+    return []
+
+def quarantine_order_file(file_name, errors, orders_dir=LOCAL_ORDERS_DIR, quarantine_dir=ORDER_QUARANTINE_DIR):
+    """move an invalid order file to the quarantine dir with a <file>.errors.txt report next to it.
+    returns the report's path"""
+    os.makedirs(quarantine_dir, exist_ok=True)
+    os.replace(os.path.join(orders_dir, file_name), os.path.join(quarantine_dir, file_name))
+
+    report_path = os.path.join(quarantine_dir, f"{file_name}.errors.txt")
+    with open(report_path, 'w') as f:
+        f.write(f"{file_name} was not uploaded:\n")
+        for error in errors[:MAX_REPORTED_ERRORS]:
+            f.write(f"  {error}\n")
+        if len(errors) > MAX_REPORTED_ERRORS:
+            f.write(f"  ... and {len(errors) - MAX_REPORTED_ERRORS} more\n")
+        f.write("\nfix the file and put it back in the FTP orders folder to have it picked up again.\n")
+    return report_path
+
+def screen_order_files(file_names, orders_dir=LOCAL_ORDERS_DIR):
+    """validate + normalize order files before upload. invalid ones are quarantined, marked 'invalid'
+    in the order ledger and reported by e-mail. returns the files that are fine to upload"""
+    if not ORDER_VALIDATION or not file_names:
+        return list(file_names)
+
+    valid = []
+    with span('orders.validate', files=len(file_names)) as attrs:
+        for file_name in file_names:
+            try:
+                errors = check_order_file(os.path.join(orders_dir, file_name))
+            except OSError as e:
+                logger.error(f"could not check {file_name}: {e}")
+                continue  # stays 'archived' in the ledger and is tried again next run
+            if not errors:
+                valid.append(file_name)
+                continue
+
+            logger.error(f"{file_name} is not a valid order file, quarantining it: {'; '.join(errors[:5])}")
+            report_path = quarantine_order_file(file_name, errors, orders_dir)
+            order_ledger.record_invalid(file_name, '; '.join(errors[:5]))
+            from utils.email_utils import send_email_attachment
+            send_email_attachment(
+                f"perfumebot quarantined order file {file_name}",
+                f"{file_name} failed validation and was moved to {ORDER_QUARANTINE_DIR} instead of being uploaded.\n\n"
+                + '\n'.join(errors[:10]),
+                report_path,
+            )
+        attrs['invalid'] = len(file_names) - len(valid)
+    return valid
@@ -1,10 +1,14 @@
 import os
+import csv
 import sys
+import hashlib
 import logging
-import requests
 from dotenv import load_dotenv
-from utils.ftp_utils import connect_ftp, upload_files
+from utils.ftp_utils import ftp_pool, upload_files, upload_fileobj
 from utils.email_utils import send_email
+from utils.http_session import SESSION_PROBE, get_http_session, probe_session, save_http_cookies
+from utils.run_state import INVENTORY_STATE_FILE, INVENTORY_COOKIE_FILE, load_state, save_state
+from utils.metrics import timed
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -13,81 +17,231 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-def download_inventory_to_csv(output_filename='/Users/flippackstation5/python_scripts/PerfumeShopBot/shopify.csv'):
-    session = requests.Session()
+INVENTORY_OUTPUT_PATH = os.getenv('INVENTORY_OUTPUT_PATH', '/Users/flippackstation5/python_scripts/PerfumeShopBot/shopify.csv')
+INVENTORY_REMOTE_DIR = '/in/inventory'
+INVENTORY_CHUNK_SIZE = int(os.getenv('INVENTORY_CHUNK_SIZE', 64 * 1024)) # bytes
+# send the feed to FTP while it downloads instead of after (skips the unchanged-content check)
+INVENTORY_STREAM_TO_FTP = os.getenv('INVENTORY_STREAM_TO_FTP', 'false').lower() in ('1', 'true', 'yes')
+INVENTORY_SKU_COLUMN = os.getenv('INVENTORY_SKU_COLUMN', 'SKU')
+# upload only the rows that changed since the last snapshot instead of the whole feed
+INVENTORY_UPLOAD_DELTA = os.getenv('INVENTORY_UPLOAD_DELTA', 'false').lower() in ('1', 'true', 'yes')
 
-    login_url = os.getenv('INVENTORY_LOGIN_URL')
-    login_data = {
-        'login_email': os.getenv('LOGIN_USERNAME'),
-        'login_pass': os.getenv('LOGIN_PASSWORD'),
-    }
+INVENTORY_CHANGED = 'changed'
+INVENTORY_UNCHANGED = 'unchanged'
 
-    # attempt login
-    logger.info('starting job to scrape inventory')
-    logger.info("logging into vendor site")
-    login_response = session.post(login_url, data=login_data)
-    if not login_response.ok:
-        logger.error("failed to login to download inventory")
-        send_email('inventory login failed', "failed to login to download inventory")
-        return False
+class InventoryStream:
+    """file-like reader over the download's chunks that hashes each chunk and copies it to the local snapshot as it's read"""
 
-    # download inventory file
-    logger.info("login successful. downloading inventory file...")
+    def __init__(self, chunks, local_file):
+        self._chunks = iter(chunks)
+        self._local_file = local_file
+        self._digest = hashlib.sha256()
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        # storbinary only needs *some* bytes per call, so hand back one chunk at a time
+        for chunk in self._chunks:
+            if chunk:
+                self._digest.update(chunk)
+                self._local_file.write(chunk)
+                self.bytes_read += len(chunk)
+                return chunk
+        return b''
+
+    def drain(self):
+        while self.read():
+            pass
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+def load_inventory_state(state_file=INVENTORY_STATE_FILE):
+    return load_state(state_file)
+
+def save_inventory_state(state, state_file=INVENTORY_STATE_FILE):
+    save_state(state, state_file)
+
+def _rows_by_sku(path, sku_column):
+    """(header, {sku: row}), or (header, None) when the rows can't be keyed by SKU: no sku_column in
+    the header, or the same SKU on more than one row"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        if sku_column not in header:
+            return header, None
+        sku_index = header.index(sku_column)
+        rows = [row for row in reader if len(row) > sku_index]
+    by_sku = {row[sku_index]: row for row in rows}
+    return header, by_sku if len(by_sku) == len(rows) else None
+
+def diff_inventory(old_path, new_path, delta_path, sku_column=INVENTORY_SKU_COLUMN):
+    """write the rows that were added or changed in new_path (keyed by SKU) to delta_path. returns the
+    counts, or None if a delta can't describe the change (no usable SKU column, or SKUs were removed --
+    a delta has no way to say so). then there is no delta file and the full feed has to go up"""
+    _, old_rows = _rows_by_sku(old_path, sku_column)
+    header, new_rows = _rows_by_sku(new_path, sku_column)
+    if os.path.exists(delta_path):
+        os.remove(delta_path)
+
+    if old_rows is None or new_rows is None:
+        logger.info(f"inventory diff: no unique '{sku_column}' column to key rows by. uploading the full feed")
+        return None
+    removed = len(old_rows.keys() - new_rows.keys())
+    if removed:
+        logger.info(f"inventory diff: {removed} SKU(s) removed. uploading the full feed")
+        return None
+    changed = [row for sku, row in new_rows.items() if old_rows.get(sku) != row]
+
+    with open(delta_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(changed)
+
+    logger.info(f"inventory diff: {len(changed)} added/changed SKUs")
+    return len(changed), removed
+
+def delta_path_for(output_filename):
+    base, ext = os.path.splitext(output_filename)
+    return f"{base}_delta{ext}"
+
+@timed('inventory.download')
+def download_inventory_to_csv(output_filename=INVENTORY_OUTPUT_PATH, stream_to_remote=None):
+    """download the feed to output_filename in INVENTORY_CHUNK_SIZE chunks (never the whole file in memory).
+
+    with stream_to_remote set, the same chunks are uploaded to that FTP path while they download.
+    """
+    # start from the last run's cookies -- if the feed still answers to them the login can be skipped
+    with get_http_session(INVENTORY_COOKIE_FILE) as session:
+        return _download_inventory(session, output_filename, stream_to_remote)
+
+def _download_inventory(session, output_filename, stream_to_remote):
     inventory_url = os.getenv('INVENTORY_FILE_URL')
-    inventory_url_response = session.get(inventory_url)
+
+    logger.info('starting job to scrape inventory')
+    if SESSION_PROBE and session.cookies and probe_session(session, inventory_url, method='HEAD'):
+        logger.info("saved inventory session is still valid. skipping login")
+    else:
+        login_url = os.getenv('INVENTORY_LOGIN_URL')
+        login_data = {
+            'login_email': os.getenv('LOGIN_USERNAME'),
+            'login_pass': os.getenv('LOGIN_PASSWORD'),
+        }
+
+        # attempt login
+        logger.info("logging into vendor site")
+        login_response = session.post(login_url, data=login_data)
+        if not login_response.ok:
+            logger.error("failed to login to download inventory")
+            send_email('inventory login failed', "failed to login to download inventory")
+            return False
+
+        # keep the cookies so the precheck can ask about the feed without logging in
+        save_http_cookies(session, INVENTORY_COOKIE_FILE)
+
+    # download inventory file, unless it hasn't changed since our last copy
+    logger.info("downloading inventory file...")
+    state = load_inventory_state()
+    headers = {}
+    if os.path.isfile(output_filename):
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
+
+    inventory_url_response = session.get(inventory_url, headers=headers, stream=True)
+    if inventory_url_response.status_code == 304:
+        inventory_url_response.close()
+        logger.info("inventory file not modified since last download")
+        return INVENTORY_UNCHANGED
     if not inventory_url_response.ok:
+        inventory_url_response.close()
         logger.error("failed to download inventory file")
         send_email('inventory file download failed', "failed to download inventory file")
         return False
 
-    # save csv locally
+    # save csv locally, diffing against the previous snapshot before replacing it
     try:
-        with open(output_filename, 'wb') as f:
-            f.write(inventory_url_response.content)
-        logger.info(f"inventory file saved as '{output_filename}'")
-        return True
+        tmp_filename = f"{output_filename}.tmp"
+        with inventory_url_response, open(tmp_filename, 'wb') as f:
+            stream = InventoryStream(inventory_url_response.iter_content(INVENTORY_CHUNK_SIZE), f)
+            if stream_to_remote:
+                # a half-consumed stream can't be replayed, so no automatic retry here
+                ftp_pool.run(upload_fileobj, stream, stream_to_remote, retries=0)
+                logger.info(f"inventory streamed to FTP as '{stream_to_remote}' ({stream.bytes_read} bytes)")
+            stream.drain()
+
+        sha256 = stream.hexdigest()
+        status = INVENTORY_UNCHANGED if sha256 == state.get('sha256') and os.path.isfile(output_filename) else INVENTORY_CHANGED
+        if status == INVENTORY_CHANGED and os.path.isfile(output_filename):
+            if diff_inventory(output_filename, tmp_filename, delta_path_for(output_filename)) is not None:
+                state['delta_base_sha256'] = state.get('sha256')  # the snapshot the delta is relative to
+            else:
+                state.pop('delta_base_sha256', None)
+        os.replace(tmp_filename, output_filename)
+
+        state.update({
+            'etag': inventory_url_response.headers.get('ETag'),
+            'last_modified': inventory_url_response.headers.get('Last-Modified'),
+            'sha256': sha256,
+        })
+        if stream_to_remote:
+            state['uploaded_sha256'] = sha256
+        save_inventory_state(state)
+        logger.info(f"inventory file saved as '{output_filename}' ({status})")
+        return status
     except Exception as e:
         logger.error(f"error writing file '{output_filename}': {e}")
         send_email('inventory file write failed', str(e))
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
         return False
 
-def upload_inventory_to_ftp(local_path, remote_directory='/in/inventory'):
+@timed('inventory.upload')
+def upload_inventory_to_ftp(local_path, remote_directory=INVENTORY_REMOTE_DIR):
     remote_path = os.path.join(remote_directory, os.path.basename(local_path))
 
-    ftp = connect_ftp()
-    if not ftp:
-        logger.error("failed to connect to FTP server")
-        send_email('FTP connection failed (inventory)', "failed to connect to FTP server")
-        return False
-
     try:
-        upload_files(ftp, local_path, remote_path)
+        ftp_pool.run(upload_files, local_path, remote_path)
         logger.info(f"successfully uploaded '{local_path}' to FTP as '{remote_path}'")
         return True
     except Exception as e:
         logger.error(f"error uploading '{local_path}' to FTP: {e}")
         send_email('FTP upload failed', str(e))
         return False
-    finally:
-        ftp.quit()
-        logger.info('FTP connection closed')
 
 def scrape_inventory():
-    output_filename = '/Users/flippackstation5/python_scripts/PerfumeShopBot/shopify.csv'
+    output_filename = INVENTORY_OUTPUT_PATH
+    stream_to_remote = None
+    if INVENTORY_STREAM_TO_FTP:
+        stream_to_remote = os.path.join(INVENTORY_REMOTE_DIR, os.path.basename(output_filename))
     
     # download inventory file
-    downloaded = download_inventory_to_csv(output_filename)
+    downloaded = download_inventory_to_csv(output_filename, stream_to_remote)
     if not downloaded:
         logger.error("download step failed. aborting scrape_inventory.")
         return False
 
-    # upload inventory file
-    uploaded = upload_inventory_to_ftp(output_filename)
+    # skip the FTP push entirely when the feed is byte-for-byte what we last uploaded
+    state = load_inventory_state()
+    if state.get('sha256') and state.get('sha256') == state.get('uploaded_sha256'):
+        logger.info("inventory unchanged since last upload. skipping FTP push.")
+        return True
+
+    # upload inventory file (or just the changed rows)
+    upload_path = output_filename
+    delta_path = delta_path_for(output_filename)
+    # the delta is only safe if downstream already has the snapshot it was diffed against
+    if INVENTORY_UPLOAD_DELTA and state.get('uploaded_sha256') and state.get('delta_base_sha256') == state['uploaded_sha256'] and os.path.isfile(delta_path):
+        upload_path = delta_path
+    uploaded = upload_inventory_to_ftp(upload_path)
     if not uploaded:
         logger.error("upload step failed. aborting scrape_inventory.")
         return False
 
+    state['uploaded_sha256'] = state.get('sha256')
+    save_inventory_state(state)
     return True
 
 if __name__ == '__main__':
-    scrape_inventory()
\ No newline at end of file
+    scrape_inventory()
+    ftp_pool.close()
\ No newline at end of file
@@ -1,17 +1,23 @@
+import io
 import os
 import sys
 import logging
 import pandas as pd
+import requests
 from dotenv import load_dotenv
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from utils.ftp_utils import connect_ftp, upload_files
+from utils.ftp_utils import ftp_pool, upload_fileobj
 from utils.email_utils import send_email
-from utils.selenium_login import perfume_selenium_login
-from utils.selenium_setup import get_headless_driver
+from utils.selenium_session import SeleniumSession
+from utils.http_session import get_http_session, http_login, HTTP_TIMEOUT
+from utils.download_waiter import wait_for_download
+from utils.tracking_csv import filter_tracking_csv, keep_tracking_column
+from utils.tracking_index import open_tracking_index, filter_unsent_rows
+from utils.metrics import timed
+from utils.wait_policy import wait_until
+from utils.selenium_setup import load_page
 from datetime import datetime, timedelta
-import time
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -23,16 +29,29 @@ load_dotenv(override=True)
 LOGIN_USERNAME = os.getenv('LOGIN_USERNAME')
 LOGIN_PASSWORD = os.getenv('LOGIN_PASSWORD')
 
-def download_tracking_to_csv():
+# 'selenium' clicks csvBtn in chrome, 'http' requests TRACKING_EXPORT_URL directly and never touches disk
+TRACKING_DOWNLOAD_MODE = os.getenv('TRACKING_DOWNLOAD_MODE', 'selenium').lower()
+TRACKING_EXPORT_URL = os.getenv('TRACKING_EXPORT_URL')
+TRACKING_FILENAME = '4101_tps_tracking.csv'
+TRACKING_DOWNLOAD_TIMEOUT = float(os.getenv('TRACKING_DOWNLOAD_TIMEOUT', 300)) # seconds
+# 'pandas' parses the export with pandas (only the kept columns), 'stream' copies the kept columns
+# through as text in fixed-size chunks. both write to a new file and rename it into place.
+TRACKING_CSV_MODE = os.getenv('TRACKING_CSV_MODE', 'pandas').lower()
+
+@timed('tracking.download')
+def download_tracking_to_csv(session):
     logger.info('starting job to scrape tracking file')
-    driver = get_headless_driver()
-    logged_in = perfume_selenium_login(driver, LOGIN_USERNAME, LOGIN_PASSWORD)
-    if not logged_in:
+    driver = session.get_driver('tracking')
+    if not driver:
         logger.info('Log in failed --quitting')
-        driver.quit()
         return None
     
     try:
+        # clear out a previous export so chrome doesn't save this one as "(1).csv"
+        previous_file = os.path.join(session.download_dir, TRACKING_FILENAME)
+        if os.path.exists(previous_file):
+            os.remove(previous_file)
+
         #format the url to download the tracking file
         # today = datetime.today()
 
@@ -40,92 +59,153 @@ def download_tracking_to_csv():
         url = f"{orders_page_url}?status=2&view=50"
 
         logger.info(f"navigating to tracking file URL: {url}")
-        driver.get(url)
-
-        wait = WebDriverWait(driver, 30)
-        super_long_wait = WebDriverWait(driver, 240)
+        load_page(driver, url, 'orders')
 
         logger.info("clicking first download CSV utton")
-        download_csv_button = wait.until(
-            EC.element_to_be_clickable((By.ID, 'csvBtn'))
-        )
+        download_csv_button = wait_until(driver, 'tracking.csvBtn', EC.element_to_be_clickable((By.ID, 'csvBtn')), 30)
         download_csv_button.click()
         logger.info("clicked the download csv button.")
 
-        confirm_button = super_long_wait.until(
-            EC.element_to_be_clickable(
-                (By.CSS_SELECTOR, 'button.swal2-confirm.swal2-styled')
-            )
-        )
+        confirm_button = wait_until(driver, 'tracking.confirm', EC.element_to_be_clickable(
+            (By.CSS_SELECTOR, 'button.swal2-confirm.swal2-styled')
+        ), 240)
         confirm_button.click()
         logger.info("clicked the confirm download button in the popup.")
 
-        filename = '4101_tps_tracking.csv'
-        return filename
+        # returns as soon as the file is fully written, instead of guessing with a sleep
+        file_path = wait_for_download(session.download_dir, TRACKING_FILENAME, timeout=TRACKING_DOWNLOAD_TIMEOUT)
+        if not file_path:
+            logger.error("tracking file download did not finish")
+            return None
+        return TRACKING_FILENAME
 
     except Exception as e:
         logger.exception("failed to download tracking file.")
         return None
-    finally:
-        time.sleep(5)  # wait for file to download before closing
-        driver.quit()
 
+@timed('tracking.download_http')
+def download_tracking_http(http_session):
+    """request the full status=2 csv export with the logged-in session. returns a streaming response or None"""
+    if not TRACKING_EXPORT_URL:
+        logger.error("TRACKING_EXPORT_URL is not set --cannot download tracking over http")
+        return None
+
+    # no 'view' param: the export endpoint returns every shipped order, not just one page of 50
+    params = {'status': 2}
+    for attempt in range(2):
+        logger.info(f"requesting tracking export: {TRACKING_EXPORT_URL}")
+        response = http_session.get(TRACKING_EXPORT_URL, params=params, stream=True, timeout=HTTP_TIMEOUT)
+        content_type = response.headers.get('Content-Type', '')
+        if response.ok and 'html' not in content_type:
+            response.raw.decode_content = True  # let the csv parser read decompressed bytes
+            return response
+
+        # an html page instead of a csv means we got bounced to the login page
+        response.close()
+        if attempt == 0:
+            logger.info("tracking export needs a fresh login...")
+            if not http_login(http_session):
+                break
+
+    logger.error("failed to download tracking export over http")
+    return None
+
+@timed('tracking.process_csv')
 def process_csv_file(file_path):
+    tmp_path = f"{file_path}.tmp"
     try:
-        df = pd.read_csv(file_path)
-        logger.info("CSV file loaded successfully")
-
-        # List of columns to remove
-        columns_to_remove = [
-            "First Name", "Last Name", "Address 1", "Address 2", 
-            "City", "State", "Zip", "SKU", "Pcs", "Unit Price", 
-            "Shipping Cost", "Order Date"
-        ]
-        
-        # Remove the columns if they exist in the DataFrame
-        existing_columns_to_remove = [col for col in columns_to_remove if col in df.columns]
-        if existing_columns_to_remove:
-            df.drop(columns=existing_columns_to_remove, inplace=True)
-            logger.info(f"Removed columns: {existing_columns_to_remove}")
+        if TRACKING_CSV_MODE == 'stream':
+            with open(tmp_path, 'wb') as f:
+                rows = filter_tracking_csv(file_path, f)
+            logger.info(f"CSV file filtered in chunks ({rows} rows)")
         else:
-            logger.info("No matching columns found to remove.")
-        
-        df.to_csv(file_path, index=False)
+            # only the kept columns are parsed at all
+            df = pd.read_csv(file_path, usecols=keep_tracking_column)
+            logger.info(f"CSV file loaded successfully with columns: {list(df.columns)}")
+            df.to_csv(tmp_path, index=False)
+
+        os.replace(tmp_path, file_path)  # readers never see a half-written file
         logger.info(f"Processed CSV saved as '{file_path}'")
     except Exception as e:
         logger.error(f"Error processing CSV file '{file_path}': {e}")
         send_email('CSV processing failed', str(e))
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
         raise
 
-def upload_tracking_to_ftp(filename, remote_directory='/in/fulfillments'):
-    downloads_path = os.path.expanduser('~/Downloads')
-    local_path = os.path.join(downloads_path, filename)
+def process_csv_stream(source):
+    """same as process_csv_file() but reads from a file object and returns the result in memory"""
+    try:
+        if TRACKING_CSV_MODE == 'stream':
+            output = io.BytesIO()
+            rows = filter_tracking_csv(source, output)
+            logger.info(f"CSV stream filtered in chunks ({rows} rows)")
+            return output
 
-    if not os.path.isfile(local_path):
-        logger.error(f"file does not exist: {local_path}")
-        send_email('FTP upload failed (Tracking)', f'file does not exist: {local_path}')
-        return False
+        df = pd.read_csv(source, usecols=keep_tracking_column)
+        logger.info(f"CSV stream loaded successfully with columns: {list(df.columns)}")
+        return io.BytesIO(df.to_csv(index=False).encode('utf-8'))
+    except Exception as e:
+        logger.error(f"Error processing CSV stream: {e}")
+        send_email('CSV processing failed', str(e))
+        raise
 
-    remote_path = os.path.join(remote_directory, os.path.basename(local_path))
+def drop_sent_rows(source, destination, index):
+    """keep only tracking rows not pushed before (everything on a full resync). returns (rows, keys, full_resync)"""
+    full_resync = index.full_resync_due()
+    if full_resync:
+        logger.info("tracking full resync due. uploading every row")
+    rows, keys = filter_unsent_rows(source, destination, index, full_resync)
+    logger.info(f"{rows} tracking row(s) not uploaded before")
+    return rows, keys, full_resync
 
-    ftp = connect_ftp()
-    if not ftp:
-        logger.error("Failed to connect to FTP server.")
-        send_email('FTP connection failed (Tracking)', "failed to connect to FTP server.")
-        return False
+def tracking_upload_name(index, full_resync):
+    """the name a tracking file goes up to /in/fulfillments under. a dedup delta gets its own
+    timestamped name, so one the importer hasn't picked up yet is never overwritten by the next
+    (that would lose its rows for good). full exports keep the usual fixed name"""
+    if index is None or full_resync:
+        return TRACKING_FILENAME
+    stem, ext = os.path.splitext(TRACKING_FILENAME)
+    return f"{stem}_{datetime.now().strftime('%Y%m%d-%H%M%S')}{ext}"
+
+def mark_tracking_sent(index, keys, full_resync):
+    # only after the upload went through, so a failed upload is retried in full next run
+    try:
+        index.mark_sent(keys)
+        if full_resync:
+            index.record_full_resync()
+        index.compact()
+    except Exception as e:
+        logger.error(f"failed to update the tracking index: {e}", exc_info=True)
+
+def upload_tracking_fileobj(fileobj, filename, remote_directory='/in/fulfillments'):
+    remote_path = os.path.join(remote_directory, filename)
+
+    def upload(ftp):
+        fileobj.seek(0)  # start over if a dropped connection made the pool retry
+        upload_fileobj(ftp, fileobj, remote_path)
 
     try:
         # upload the file
-        upload_files(ftp, local_path, remote_path)
-        logger.info(f"successfully uploaded '{local_path}' to FTP: '{remote_path}'")
+        ftp_pool.run(upload)
+        logger.info(f"successfully uploaded '{filename}' to FTP: '{remote_path}'")
         return True
     except Exception as e:
-        logger.exception(f"error uploading '{local_path}' to FTP.")
-        send_email('FTP upload failed (tracking)', f"error uploading '{local_path}': {e}")
+        logger.exception(f"error uploading '{filename}' to FTP.")
+        send_email('FTP upload failed (tracking)', f"error uploading '{filename}': {e}")
         return False
-    finally:
-        ftp.quit()
-        logger.info("FTP connection closed")
+
+def upload_tracking_to_ftp(filename, remote_directory='/in/fulfillments', downloads_dir='~/Downloads', remote_name=None):
+    downloads_path = os.path.expanduser(downloads_dir)
+    local_path = os.path.join(downloads_path, filename)
+
+    if not os.path.isfile(local_path):
+        logger.error(f"file does not exist: {local_path}")
+        send_email('FTP upload failed (Tracking)', f'file does not exist: {local_path}')
+        return False
+
+    with open(local_path, 'rb') as local_file:
+        return upload_tracking_fileobj(local_file, remote_name or os.path.basename(local_path), remote_directory)
 
 def delete_tracking_file_after_upload(filename, downloads_dir='~/Downloads'):
     try:
@@ -144,14 +224,78 @@ def delete_tracking_file_after_upload(filename, downloads_dir='~/Downloads'):
         send_email('tracking file deletion failed', f"failed to delete the tracking file {filename}: {e}")
         return False
 
-def scrape_tracking():
-    downloaded_filename = download_tracking_to_csv()
+def scrape_tracking_http(index=None):
+    """download -> filter -> FTP without a browser or temp files. returns None if the download itself failed"""
+    http_session = get_http_session()
+    try:
+        try:
+            response = download_tracking_http(http_session)
+        except requests.RequestException as e:
+            logger.error(f"tracking export request failed: {e}")
+            response = None
+        if response is None:
+            return None
+
+        with response:
+            try:
+                tracking_csv = process_csv_stream(response.raw)
+            except Exception:
+                logger.error("CSV processing failed")
+                return False
+
+        full_resync = False
+        if index is not None:
+            tracking_csv.seek(0)
+            new_rows = io.BytesIO()
+            try:
+                rows, keys, full_resync = drop_sent_rows(tracking_csv, new_rows, index)
+                tracking_csv = new_rows
+            except Exception as e:
+                logger.error(f"tracking dedup failed, uploading every row: {e}", exc_info=True)
+                index = None
+        if index is not None and not rows:
+            logger.info("no new tracking rows. nothing to upload")
+            return True
+
+        uploaded = upload_tracking_fileobj(tracking_csv, tracking_upload_name(index, full_resync))
+        if not uploaded:
+            logger.error("upload step failed --quitting")
+            return False
+        if index is not None:
+            mark_tracking_sent(index, keys, full_resync)
+
+        logger.info("tracking export streamed from site and uploaded to FTP.")
+        return True
+    finally:
+        http_session.close()
+
+def scrape_tracking(session=None):
+    # no shared browser passed in -- use one just for this job (chrome only starts if it's needed)
+    if session is None:
+        with SeleniumSession(LOGIN_USERNAME, LOGIN_PASSWORD) as session:
+            return scrape_tracking(session)
+
+    index = open_tracking_index()
+    try:
+        return _scrape_tracking(session, index)
+    finally:
+        if index is not None:
+            index.close()
+
+def _scrape_tracking(session, index):
+    if TRACKING_DOWNLOAD_MODE == 'http':
+        uploaded = scrape_tracking_http(index)
+        if uploaded is not None:
+            return uploaded
+        logger.warning("http tracking export failed. falling back to the browser download")
+
+    downloaded_filename = download_tracking_to_csv(session)
     if not downloaded_filename:
         logger.error("download tracking failed --quitting")
         return False
     
-    # Build the full file path in the Downloads directory
-    downloads_path = os.path.expanduser('~/Downloads')
+    # Build the full file path in the session's download directory
+    downloads_path = session.download_dir
     file_path = os.path.join(downloads_path, downloaded_filename)
     
     # Process CSV: remove columns C–M and column R
@@ -161,12 +305,32 @@ def scrape_tracking():
         logger.error("CSV processing failed")
         return False
 
-    uploaded = upload_tracking_to_ftp(downloaded_filename)
+    full_resync = False
+    if index is not None:
+        tmp_path = f"{file_path}.tmp"
+        try:
+            with open(file_path, 'rb') as source, open(tmp_path, 'wb') as destination:
+                rows, keys, full_resync = drop_sent_rows(source, destination, index)
+            os.replace(tmp_path, file_path)
+        except Exception as e:
+            logger.error(f"tracking dedup failed, uploading every row: {e}", exc_info=True)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            index = None
+    if index is not None and not rows:
+        logger.info("no new tracking rows. nothing to upload")
+        delete_tracking_file_after_upload(downloaded_filename, downloads_dir=downloads_path)
+        return True
+
+    uploaded = upload_tracking_to_ftp(downloaded_filename, downloads_dir=downloads_path,
+                                      remote_name=tracking_upload_name(index, full_resync))
     if not uploaded:
         logger.error("upload step failed --quitting")
         return False
+    if index is not None:
+        mark_tracking_sent(index, keys, full_resync)
 
-    deleted = delete_tracking_file_after_upload(downloaded_filename)
+    deleted = delete_tracking_file_after_upload(downloaded_filename, downloads_dir=downloads_path)
     if not deleted:
         logger.warning(f"file {downloaded_filename} was not deleted from downloads folder.")
 
@@ -175,4 +339,5 @@ def scrape_tracking():
 
 if __name__ == '__main__':
     success = scrape_tracking()
+    ftp_pool.close()
     sys.exit(0 if success else 1)
\ No newline at end of file
@@ -4,7 +4,6 @@ import re
 from dotenv import load_dotenv
 from utils.email_utils import send_email_attachment
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import (
     ElementClickInterceptedException,
@@ -12,6 +11,9 @@ from selenium.common.exceptions import (
     TimeoutException
 )
 import time
+from utils.metrics import timed
+from utils.wait_policy import wait_until, wait_for_any
+from utils.selenium_setup import load_page
 
 load_dotenv()
 
@@ -21,29 +23,33 @@ logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
 )
 
+@timed('upload_order')
 def upload_order(driver, file_path):
+    """upload, proceed past the address check and submit one order file in the browser.
 
-    # selenium shortcuts
-    driver_short_wait = WebDriverWait(driver, 10)
-    driver_long_wait = WebDriverWait(driver, 30)
+    returns (success, batch number, submitted). submitted is True once the submit button may have
+    been clicked -- a failure before that never reached the vendor and is safe to retry.
+    """
 
-    def short_wait(by, value, short_wait=driver_short_wait):
-            return short_wait.until(EC.element_to_be_clickable((by, value)))
+    # selenium shortcuts. the timeouts are the upper limit -- see utils/wait_policy.py
+    def short_wait(by, value):
+            return wait_until(driver, f"upload.{value}", EC.element_to_be_clickable((by, value)), 10)
 
-    def long_wait(by, value, long_wait=driver_long_wait):
-            return long_wait.until(EC.element_to_be_clickable((by, value)))
+    def long_wait(by, value):
+            return wait_until(driver, f"upload.{value}", EC.element_to_be_clickable((by, value)), 30)
 
     # Check if the order is an actual file and not a dir
     if not os.path.isfile(file_path):  
         logger.error(f"File not found: {file_path}")
-        return False, None
+        return False, None, False
     
     batch_number = None
     oos_detected = False
+    submitted = False
 
     # upload the order file
     try:
-        driver.get(os.getenv('UPLOAD_URL'))
+        load_page(driver, os.getenv('UPLOAD_URL'), 'upload')
 
         logger.info(f"Uploading file: {file_path}")
         upload_file_input = long_wait(By.ID, 'formFile')
@@ -61,11 +67,22 @@ def upload_order(driver, file_path):
             driver.execute_script("arguments[0].click();", upload_button)
             logger.info("Upload file submit button clicked with fallback")
 
-        # override address validation if necessary
+        # override address validation if necessary. waits for whichever shows up first, the prompt or
+        # the submit button, instead of giving the prompt 10 seconds on every order
         try:
              logger.info('checking for address verification prompt')
-             proceed_button = short_wait(By.CLASS_NAME, 'proceedBtn')
-             proceed_button.click()
+             shown, button = wait_for_any(driver, 'upload.after_upload', {
+                 'proceed': EC.element_to_be_clickable((By.CLASS_NAME, 'proceedBtn')),
+                 'submit': EC.element_to_be_clickable((By.ID, 'submitBtn')),
+             }, 20)
+             if shown == 'submit':
+                 # the prompt can sit on top of an already-rendered submit button
+                 button = next((b for b in driver.find_elements(By.CLASS_NAME, 'proceedBtn') if b.is_displayed()), None)
+             if button is not None:
+                 button.click()
+                 logger.info('address verification prompt found. clicked proceed')
+             else:
+                 logger.info('address already verfied')
         except (TimeoutException, NoSuchElementException):
              logger.info('address already verfied')
 
@@ -94,6 +111,7 @@ def upload_order(driver, file_path):
 
         # submit the order
         logger.info('submitting the order')
+        submitted = True  # from here on the vendor may have the batch
         try:
             submit_order_btn = short_wait(By.ID, 'submitBtn')
             driver.execute_script("arguments[0].scrollIntoView(true);", submit_order_btn) #scroll into view
@@ -107,7 +125,7 @@ def upload_order(driver, file_path):
 
         # Wait for order success message & scrape it
         logger.info("Waiting for success message...")
-        success_alert = driver_long_wait.until(EC.presence_of_element_located((By.CLASS_NAME, "mb-0")))
+        success_alert = wait_until(driver, 'upload.confirmation', EC.presence_of_element_located((By.CLASS_NAME, "mb-0")), 30)
             
         success_message = success_alert.text
         logger.info(f"Success message found: {success_message}")  # Display success msg
@@ -125,7 +143,9 @@ def upload_order(driver, file_path):
         if batch_number:
             logger.info(f"Scraped batch number: {batch_number}")
 
-            return True, batch_number  # If we get here, everything worked & order submitted
-        
+            return True, batch_number, True  # If we get here, everything worked & order submitted
+        logger.error("order submitted but no batch number found in the success message")
+
     except Exception as e:
-        return False, None
\ No newline at end of file
+        logger.error(f"order upload failed {'after' if submitted else 'before'} submit: {e}")
+    return False, None, submitted
\ No newline at end of file
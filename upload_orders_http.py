@@ -0,0 +1,120 @@
+import logging
+import os
+import re
+import requests
+from urllib.parse import urljoin
+from dotenv import load_dotenv
+from utils.html_forms import parse_page, find_form, form_data, unsupported_fields
+from utils.http_session import http_login, HTTP_TIMEOUT
+from utils.metrics import timed
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+
+# 'selenium' drives the upload page in chrome, 'http' posts the same forms directly
+ORDER_UPLOAD_MODE = os.getenv('ORDER_UPLOAD_MODE', 'selenium').lower()
+
+class HttpUploadUnsupported(Exception):
+    """the page didn't look like we expected before anything was submitted -- safe to retry in the browser"""
+
+def _check_form(form):
+    # a form with fields we can't fill in like the browser would is left to the browser
+    fields = unsupported_fields(form)
+    if fields:
+        raise HttpUploadUnsupported(f"form has fields the http upload can't fill in: {', '.join(fields)}")
+
+def _submit(session, response, form, submitter, files=None):
+    _check_form(form)
+    url = urljoin(response.url, form['action'] or response.url)
+    data = form_data(form, submitter)
+    if form['method'] == 'post' or files:
+        return session.post(url, data=data, files=files, timeout=HTTP_TIMEOUT)
+    return session.get(url, params=data, timeout=HTTP_TIMEOUT)
+
+def _load_upload_page(session):
+    upload_url = os.getenv('UPLOAD_URL')
+    for attempt in range(2):
+        response = session.get(upload_url, timeout=HTTP_TIMEOUT)
+        page = parse_page(response.text)
+        form, file_field = find_form(page, field_id='formFile')
+        if response.ok and form is not None:
+            return response, page, form, file_field
+
+        # no upload form usually means the saved session expired
+        if attempt == 0:
+            logger.info("upload form not found over http. logging in...")
+            if not http_login(session):
+                break
+
+    raise HttpUploadUnsupported("could not reach the upload form over http")
+
+@timed('upload_order_http')
+def upload_order_http(session, file_path):
+    """same steps as upload_order() (upload, proceed past address check, submit) as plain http requests.
+
+    returns (success, batch number, submitted) like upload_order(). raises HttpUploadUnsupported if
+    something unexpected shows up before the order is submitted, so the caller can fall back to the
+    selenium upload.
+    """
+    if not os.path.isfile(file_path):
+        logger.error(f"File not found: {file_path}")
+        return False, None, False
+
+    try:
+        # 1. upload the order file
+        response, page, form, file_field = _load_upload_page(session)
+        _, upload_button = find_form(page, field_id='uploadBtn')
+
+        logger.info(f"Uploading file over http: {file_path}")
+        with open(file_path, 'rb') as f:
+            files = {file_field['name'] or 'formFile': (os.path.basename(file_path), f, 'text/csv')}
+            response = _submit(session, response, form, upload_button, files=files)
+        if not response.ok:
+            raise HttpUploadUnsupported(f"upload returned {response.status_code}")
+
+        # 2. override address validation if necessary
+        page = parse_page(response.text)
+        form, proceed_button = find_form(page, field_class='proceedBtn')
+        if form is not None:
+            logger.info('address verification prompt found. proceeding...')
+            response = _submit(session, response, form, proceed_button)
+            if not response.ok:
+                raise HttpUploadUnsupported(f"address proceed returned {response.status_code}")
+            page = parse_page(response.text)
+        else:
+            logger.info('address already verfied')
+
+        # 3. find the submit form
+        form, submit_button = find_form(page, field_id='submitBtn')
+        if form is None:
+            raise HttpUploadUnsupported("submit form not found after upload")
+        _check_form(form)  # here, while falling back to the browser is still safe
+    except requests.RequestException as e:
+        raise HttpUploadUnsupported(f"http error before submit: {e}") from e
+
+    # from here on the vendor may have created a batch, so never fall back to the browser
+    logger.info('submitting the order over http')
+    try:
+        response = _submit(session, response, form, submit_button)
+        if not response.ok:
+            logger.error(f"order submit returned {response.status_code}")
+            return False, None, True
+        success_message = ' '.join(parse_page(response.text).text_by_class.get('mb-0', [])).strip()
+    except Exception as e:
+        logger.error(f"order submit over http failed: {e}")
+        return False, None, True
+    logger.info(f"Success message found: {success_message}")
+
+    match = re.search(r'#(\d+)', success_message) #parse out just the batch number
+    batch_number = match.group(1) if match else None
+    if not batch_number:
+        logger.error("order submitted over http but no batch number found in the response")
+        return False, None, True
+
+    logger.info(f"Scraped batch number: {batch_number}")
+    return True, batch_number, True
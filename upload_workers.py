@@ -0,0 +1,134 @@
+import os
+import queue
+import logging
+import threading
+from dotenv import load_dotenv
+from upload_orders import upload_order
+from upload_orders_http import upload_order_http, HttpUploadUnsupported, ORDER_UPLOAD_MODE
+from utils.selenium_session import SeleniumSession
+from utils.session_cookies import SESSION_COOKIE_FILE
+from utils.http_session import get_http_session
+from utils import order_ledger
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+
+LOCAL_ORDERS_DIR = os.getenv('LOCAL_ORDERS_DIR')
+
+# each worker is its own logged-in browser. the vendor shows a "previous session timeout" popup when
+# the same account logs in twice, so keep this at 1 unless you've confirmed parallel sessions are ok.
+MAX_UPLOAD_WORKERS = 4
+ORDER_UPLOAD_WORKERS = max(1, min(int(os.getenv('ORDER_UPLOAD_WORKERS', 1)), MAX_UPLOAD_WORKERS))
+
+def submit_order_file(session, http_session, file_path):
+    """returns (success, batch number, submitted), see upload_order()"""
+    # http first when it's enabled, the browser only if the http flow can't handle the page
+    if http_session is not None:
+        try:
+            return upload_order_http(http_session, file_path)
+        except HttpUploadUnsupported as e:
+            logger.warning(f"http upload not possible ({e}). falling back to selenium")
+        except Exception as e:
+            # upload_order_http() handles everything from the submit on itself, so this was before it
+            logger.error(f"http upload failed: {e}", exc_info=True)
+            return False, None, False
+
+    try:
+        driver = session.get_driver('orders')
+    except Exception as e:
+        logger.error(f"could not start the browser: {e}", exc_info=True)
+        driver = None
+    if not driver:
+        logger.error("login failed --cannot upload order in browser")
+        return False, None, False
+    return upload_order(driver, file_path)
+
+def _upload_worker(index, shared_session, file_queue, results):
+    # worker 0 uses the run's shared browser, the others get their own browser + cookie file
+    if index == 0:
+        session = shared_session
+    else:
+        session = SeleniumSession(cookie_file=f"{SESSION_COOKIE_FILE}.worker{index}", profile=f"worker{index}")
+    http_session = get_http_session(session.cookie_file) if ORDER_UPLOAD_MODE == 'http' else None
+
+    try:
+        # log in before taking any work so a failed login leaves the files for the other workers
+        if http_session is None and not session.get_driver('orders'):
+            logger.error(f"upload worker {index}: login failed --stopping this worker")
+            return
+
+        while True:
+            file_name = file_queue.get()
+            if file_name is None:
+                file_queue.put(None)  # put the end marker back for the other workers
+                break
+
+            logger.info(f"upload worker {index}: starting upload for file: {file_name}")
+            # recorded before anything is sent, so a crash from here on holds the file instead of resubmitting it
+            order_ledger.mark_upload(file_name, order_ledger.UPLOADING)
+            error = None
+            try:
+                success, batch_number, submitted = submit_order_file(session, http_session, os.path.join(LOCAL_ORDERS_DIR, file_name))
+            except Exception as e:
+                logger.error(f"upload worker {index}: error uploading {file_name}: {e}", exc_info=True)
+                # both upload functions catch everything from the submit on, so this never reached the vendor
+                success, batch_number, submitted, error = False, None, False, str(e)
+            if success:
+                order_ledger.mark_upload(file_name, order_ledger.SUBMITTED, batch_number)
+            elif submitted:
+                # the vendor may have the batch -- held as 'failed' until someone checks the site
+                order_ledger.mark_upload(file_name, order_ledger.FAILED, error=error or 'submitted but no batch number confirmed')
+            else:
+                # never reached the vendor, so the next run simply tries it again
+                order_ledger.mark_upload(file_name, order_ledger.ARCHIVED, error=error or 'failed before submit')
+            results.put((file_name, success, batch_number))
+    finally:
+        if http_session is not None:
+            http_session.close()
+        if session is not shared_session:
+            session.close()
+        results.put(None)  # tells the caller this worker is finished
+
+def upload_order_stream(session, file_queue, workers=ORDER_UPLOAD_WORKERS):
+    """upload order files with `workers` browsers pulling from file_queue until they see None.
+
+    the workers log in straight away, so the browser start-up overlaps with whatever is still
+    filling the queue. yields (file_name, success, batch_number) in the caller's thread as each
+    upload finishes, so moving files and sending emails stays out of the worker threads.
+    """
+    results = queue.Queue()
+    workers = max(1, workers)
+    logger.info(f"uploading order files with {workers} worker(s)")
+
+    threads = [
+        threading.Thread(target=_upload_worker, args=(i, session, file_queue, results), name=f"upload-worker-{i}", daemon=True)
+        for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    running = len(threads)
+    while running:
+        result = results.get()
+        if result is None:
+            running -= 1
+        else:
+            yield result
+
+    # anything still queued means every worker failed to log in
+    while (file_name := file_queue.get()) is not None:
+        yield file_name, False, None
+
+def upload_order_files(session, file_names, workers=ORDER_UPLOAD_WORKERS):
+    """upload a fixed list of order files, see upload_order_stream()"""
+    file_queue = queue.Queue()
+    for file_name in file_names:
+        file_queue.put(file_name)
+    file_queue.put(None)
+
+    yield from upload_order_stream(session, file_queue, min(workers, len(file_names)))
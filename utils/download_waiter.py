@@ -0,0 +1,126 @@
+import os
+import sys
+import time
+import ctypes
+import select
+import logging
+from dotenv import load_dotenv
+from utils.metrics import timed
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+
+DOWNLOAD_TIMEOUT = float(os.getenv('DOWNLOAD_TIMEOUT', 300)) # seconds
+DOWNLOAD_SETTLE_TIME = float(os.getenv('DOWNLOAD_SETTLE_TIME', 0.5)) # size must hold still this long
+POLL_INTERVAL = 0.25 # seconds, only used when inotify isn't available
+
+PARTIAL_SUFFIXES = ('.crdownload', '.part', '.tmp')
+
+# inotify event masks (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+
+class _InotifyWatcher:
+    """blocks until something changes in a directory, using inotify on linux"""
+
+    def __init__(self, directory):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        mask = IN_CREATE | IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE
+        if self.libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch failed')
+
+    def wait(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if ready:
+            try:
+                os.read(self.fd, 64 * 1024)  # drain the events, we only care that something happened
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        os.close(self.fd)
+
+class _PollingWatcher:
+    def wait(self, timeout):
+        time.sleep(min(timeout, POLL_INTERVAL))
+
+    def close(self):
+        pass
+
+def _get_watcher(directory):
+    if sys.platform.startswith('linux'):
+        try:
+            return _InotifyWatcher(directory)
+        except (OSError, AttributeError) as e:
+            logger.info(f"inotify not available ({e}). polling for downloads instead")
+    return _PollingWatcher()
+
+def _find_finished_file(directory, filename):
+    """path of the finished download, or None while it's missing or chrome is still writing it"""
+    entries = os.listdir(directory)
+    if any(entry.endswith(PARTIAL_SUFFIXES) for entry in entries):
+        return None
+
+    if filename:
+        return os.path.join(directory, filename) if filename in entries else None
+
+    files = [os.path.join(directory, entry) for entry in entries]
+    files = [f for f in files if os.path.isfile(f)]
+    return max(files, key=os.path.getmtime) if files else None
+
+@timed('download.wait')
+def wait_for_download(directory, filename=None, timeout=DOWNLOAD_TIMEOUT, settle_time=DOWNLOAD_SETTLE_TIME):
+    """wait for a browser download in `directory` to finish and return its path.
+
+    a download counts as finished once the file exists, no .crdownload is left in the
+    directory and its size hasn't changed for `settle_time` seconds. returns None on timeout.
+    """
+    deadline = time.monotonic() + timeout
+    watcher = _get_watcher(directory)
+    last_size = None
+    stable_since = None
+
+    try:
+        while True:
+            path = _find_finished_file(directory, filename)
+            now = time.monotonic()
+
+            if path:
+                try:
+                    size = os.path.getsize(path)
+                except FileNotFoundError:
+                    size = None
+
+                if size is not None and size == last_size:
+                    if now - stable_since >= settle_time:
+                        logger.info(f"download complete: {path} ({size} bytes)")
+                        return path
+                else:
+                    last_size, stable_since = size, now
+            else:
+                last_size, stable_since = None, None
+
+            remaining = deadline - now
+            if remaining <= 0:
+                logger.error(f"timed out after {timeout}s waiting for download in {directory}")
+                return None
+
+            # wake up on the next file event, or when the size should have settled
+            wait_time = remaining if path is None else min(remaining, settle_time)
+            watcher.wait(wait_time)
+    finally:
+        watcher.close()
@@ -1,74 +1,170 @@
 import smtplib
+import atexit
+import logging
+import threading
+import queue
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
 from dotenv import load_dotenv
+from utils.metrics import span, timed
 import os
 
 load_dotenv()
 
-def send_email(subject, body):
-    sender_email = os.getenv('SENDER_EMAIL')
-    receiver_email = os.getenv('RECEIVER_EMAIL')
-    email_password = os.getenv('EMAIL_PASSWORD')
+logger = logging.getLogger(__name__)
 
-    # create email msg headers
-    msg = MIMEMultipart()
-    msg['From'] = sender_email
-    msg['To'] = receiver_email
-    msg['Subject'] = subject
+SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', 587))
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', 30)) # seconds
+# close the shared SMTP connection after this long without mail (gmail drops idle ones anyway)
+SMTP_IDLE_TIMEOUT = float(os.getenv('SMTP_IDLE_TIMEOUT', 120)) # seconds
+# 'false' sends in the caller's thread, like before
+EMAIL_ASYNC = os.getenv('EMAIL_ASYNC', 'true').lower() in ('1', 'true', 'yes')
+# collect alerts into one e-mail per run instead of one e-mail each
+EMAIL_DIGEST = os.getenv('EMAIL_DIGEST', 'false').lower() in ('1', 'true', 'yes')
 
-    # create email msg body
-    msg.attach(MIMEText(body, 'plain'))
+class SMTPConnection:
+    """one logged-in SMTP connection, opened on first use and reopened if the server dropped it"""
+
+    def __init__(self):
+        self.server = None
+        self.lock = threading.Lock()
+
+    @timed('smtp.connect')
+    def _connect(self):
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        try:
+            server.starttls()
+            server.login(os.getenv('SENDER_EMAIL'), os.getenv('EMAIL_PASSWORD'))
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def send(self, msg):
+        with self.lock:
+            for attempt in range(2):
+                if self.server is None:
+                    self.server = self._connect()
+                try:
+                    self.server.sendmail(msg['From'], msg['To'], msg.as_string())
+                    return
+                except Exception:
+                    # stale, reset or timed-out socket, or a 421 -- never reuse it. reconnect once
+                    self._discard()
+                    if attempt:
+                        raise
+
+    def _discard(self):
+        try:
+            self.server.close()
+        except Exception:
+            pass
+        self.server = None
 
-    # connect to the server and send the email
+    def close(self):
+        with self.lock:
+            if self.server is None:
+                return
+            try:
+                self.server.quit()
+            except Exception:
+                pass  # already gone
+            self.server = None
+
+smtp_connection = SMTPConnection()
+
+_outbox = queue.Queue()
+_sender = None
+_sender_lock = threading.Lock()
+_digest = []
+_digest_lock = threading.Lock()
+
+def _deliver(msg):
     try:
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, email_password)
-        text = msg.as_string()
-        server.sendmail(sender_email, receiver_email, text)
-        print("email sent successfully")
+        with span('smtp.send', subject=msg['Subject']):
+            smtp_connection.send(msg)
+        logger.info(f"email sent successfully: {msg['Subject']}")
+        return True
     except Exception as e:
-        print(f"failed to send email: {e}")
-    finally:
-        server.quit()
+        logger.error(f"failed to send email '{msg['Subject']}': {e}")
+        return False
 
+def _send_loop():
+    while True:
+        try:
+            msg = _outbox.get(timeout=SMTP_IDLE_TIMEOUT)
+        except queue.Empty:
+            smtp_connection.close()
+            continue
+        try:
+            _deliver(msg)
+        finally:
+            _outbox.task_done()
 
-def send_email_attachment(subject, body, attachment_path):
-    sender_email = os.getenv('SENDER_EMAIL')
-    receiver_email = os.getenv('RECEIVER_EMAIL')
-    email_password = os.getenv('EMAIL_PASSWORD')
-    
-    # create email msg headers
+def _enqueue(msg):
+    global _sender
+    if not EMAIL_ASYNC:
+        return _deliver(msg)
+    with _sender_lock:
+        if _sender is None:
+            _sender = threading.Thread(target=_send_loop, name='email-sender', daemon=True)
+            _sender.start()
+    _outbox.put(msg)
+    return True
+
+def _build_message(subject, body):
     msg = MIMEMultipart()
-    msg['From'] = sender_email
-    msg['To'] = receiver_email
+    msg['From'] = os.getenv('SENDER_EMAIL')
+    msg['To'] = os.getenv('RECEIVER_EMAIL')
     msg['Subject'] = subject
-    
-    # create email msg body
     msg.attach(MIMEText(body, 'plain'))
-    
-    # attach the file
+    return msg
+
+def send_email(subject, body, digest=True):
+    """queue an e-mail and return straight away. with EMAIL_DIGEST on, alerts are held for
+    flush_emails() unless digest=False (e.g. the order summary)"""
+    if EMAIL_DIGEST and digest:
+        with _digest_lock:
+            _digest.append((subject, body))
+        return True
+    return _enqueue(_build_message(subject, body))
+
+def send_email_attachment(subject, body, attachment_path):
+    msg = _build_message(subject, body)
+
+    # attach the file now -- it may be gone by the time the sender thread gets to it
     try:
         with open(attachment_path, 'rb') as file:
             attachment = MIMEApplication(file.read(), Name=os.path.basename(attachment_path))
             attachment['Content-Disposition'] = f'attachment; filename="{os.path.basename(attachment_path)}"'
             msg.attach(attachment)
     except Exception as e:
-        print(f"Failed to attach file {attachment_path}: {e}")
-    
-    # connect to the server and send the email
-    try:
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, email_password)
-        text = msg.as_string()
-        server.sendmail(sender_email, receiver_email, text)
-        print(f"Email sent successfully with attachment: {attachment_path}")
-        return True
-    except Exception as e:
-        print(f"Failed to send email: {e}")
-        return False
-    finally:
-        server.quit()
\ No newline at end of file
+        logger.error(f"Failed to attach file {attachment_path}: {e}")
+
+    return _enqueue(msg)
+
+def flush_emails(timeout=60, close=False):
+    """send the held digest, wait up to `timeout` seconds for queued mail to go out, optionally
+    close the SMTP connection. call this at the end of a run"""
+    with _digest_lock:
+        alerts = _digest[:]
+        _digest.clear()
+    if len(alerts) == 1:
+        _enqueue(_build_message(*alerts[0]))
+    elif alerts:
+        body = '\n\n'.join(f"--- {subject} ---\n{body}" for subject, body in alerts)
+        _enqueue(_build_message(f"perfumebot: {len(alerts)} alerts", body))
+
+    if _sender is not None:
+        # Queue.join() has no timeout, so wait on a helper thread instead
+        waiter = threading.Thread(target=_outbox.join, daemon=True)
+        waiter.start()
+        waiter.join(timeout)
+        if waiter.is_alive():
+            logger.warning(f"{_outbox.qsize()} email(s) still unsent after {timeout}s")
+    if close:
+        smtp_connection.close()
+
+atexit.register(flush_emails, close=True)
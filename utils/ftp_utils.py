@@ -1,8 +1,15 @@
 import os
+import time
+import posixpath
 import logging
-import sys
+import calendar
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dotenv import load_dotenv
 from ftplib import FTP, error_perm, error_temp, error_reply
+from utils.metrics import span, timed, count_retry
+from utils.wait_policy import backoff_delay
 
 load_dotenv()
 
@@ -16,6 +23,7 @@ logging.basicConfig(
 FTP_HOST = os.getenv('FTP_HOST')
 FTP_USER = os.getenv('FTP_USER')
 FTP_PASS = os.getenv('FTP_PASS')
+FTP_PORT = int(os.getenv('FTP_PORT', 21))
 
 LOCAL_ORDERS_DIR = os.getenv('LOCAL_ORDERS_DIR')
 LOCAL_PROCESSED_DIR = os.getenv('LOCAL_PROCESSED_DIR')
@@ -24,9 +32,135 @@ REMOTE_ORDERS_DIR = '/out/orders'
 REMOTE_ORDER_ARCHIVE_DIR = '/out/orders/archive' 
 REMOTE_INVENTORY_DIR='/in/inventory'
 
+FTP_POOL_SIZE = int(os.getenv('FTP_POOL_SIZE', 3))
+FTP_TIMEOUT = int(os.getenv('FTP_TIMEOUT', 60)) # seconds
+FTP_DOWNLOAD_CONNECTIONS = int(os.getenv('FTP_DOWNLOAD_CONNECTIONS', 2))
+FTP_RETRY_DELAY = float(os.getenv('FTP_RETRY_DELAY', 1)) # seconds before the first retry, doubling after that
+FTP_BLOCKSIZE = int(os.getenv('FTP_BLOCKSIZE', 1024 * 1024)) # bytes per read/write (ftplib's default is 8 KiB)
+# check the remote SIZE before an upload is renamed into place / a download against the listing
+FTP_VERIFY_SIZE = os.getenv('FTP_VERIFY_SIZE', 'true').lower() in ('1', 'true', 'yes')
+
+# errors that a fresh connection can fix (4xx replies, dropped/reset sockets, timeouts)
+TRANSIENT_FTP_ERRORS = (error_temp, error_reply, EOFError, OSError)
+
+class FTPTransferError(Exception):
+    """an FTP operation failed. transient=True means retrying on a new connection may work"""
+
+    def __init__(self, message, transient=False):
+        super().__init__(message)
+        self.transient = transient
+
+def _ftp_error(message, e):
+    return FTPTransferError(f"{message}: {e}", transient=isinstance(e, TRANSIENT_FTP_ERRORS))
+
+class FTPPool:
+    """a few logged-in FTP connections shared by every stage of a run.
+
+    connections are checked with NOOP before they're handed out and replaced
+    transparently when the server has dropped them.
+    """
+
+    def __init__(self, max_size=FTP_POOL_SIZE):
+        self.max_size = max_size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    @timed('ftp.connect')
+    def _open(self):
+        try:
+            ftp = FTP(timeout=FTP_TIMEOUT)
+            ftp.connect(FTP_HOST, FTP_PORT)
+            ftp.login(FTP_USER, FTP_PASS)
+            logger.info(f"successfully connected to FTP server: {FTP_HOST}")
+            return ftp
+        except Exception as e:
+            raise _ftp_error("failed to connect to FTP server", e) from e
+
+    @staticmethod
+    def _is_alive(ftp):
+        try:
+            ftp.voidcmd('NOOP')
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _discard(ftp):
+        try:
+            ftp.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    ftp = self._idle.pop() if self._idle else None
+                if ftp is None:
+                    return self._open()
+                if self._is_alive(ftp):
+                    return ftp
+                logger.info("idle FTP connection was dropped. reconnecting...")
+                self._discard(ftp)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, ftp, broken=False):
+        if broken:
+            self._discard(ftp)
+        else:
+            with self._lock:
+                self._idle.append(ftp)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        ftp = self.acquire()
+        broken = False
+        try:
+            yield ftp
+        except Exception as e:
+            broken = isinstance(e, TRANSIENT_FTP_ERRORS) or getattr(e, 'transient', False)
+            raise
+        finally:
+            self.release(ftp, broken=broken)
+
+    def run(self, func, *args, retries=2, **kwargs):
+        """call func(ftp, *args, **kwargs) on a pooled connection, reconnecting on transient errors"""
+        for attempt in range(retries + 1):
+            try:
+                with self.connection() as ftp:
+                    return func(ftp, *args, **kwargs)
+            except FTPTransferError as e:
+                if not e.transient or attempt == retries:
+                    raise
+                delay = backoff_delay(attempt, FTP_RETRY_DELAY)
+                logger.warning(f"{e}. retrying on a new connection in {delay:.1f}s ({attempt + 1}/{retries})")
+                count_retry('ftp')
+                time.sleep(delay)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for ftp in idle:
+            try:
+                ftp.quit()
+            except Exception:
+                self._discard(ftp)
+        if idle:
+            logger.info(f"closed {len(idle)} FTP connection(s)")
+
+# shared by main.py, scrape_inventory.py and scrape_tracking.py for the whole run
+ftp_pool = FTPPool()
+
+@timed('ftp.connect')
 def connect_ftp():
     try:
-        ftp = FTP(FTP_HOST)
+        ftp = FTP()
+        ftp.connect(FTP_HOST, FTP_PORT)
         ftp.login(FTP_USER, FTP_PASS)
         logger.info(f"successfully connected to FTP server: {FTP_HOST}")
         return ftp
@@ -40,30 +174,172 @@ def connect_ftp():
         logger.error(f"failed to connect to FTP server: {e}")
     return None
 
-def download_files(ftp):
-    downloaded_files = []  # list to keep track of files that are downloaded
+def _parse_mlsd_time(value):
+    # MLSD modify fact is UTC: YYYYMMDDHHMMSS[.sss]
+    return calendar.timegm(time.strptime(value[:14], '%Y%m%d%H%M%S'))
+
+def _parse_list_line(line):
+    """parse one unix-style LIST line into (name, size, mtime). mtime is minute precision"""
+    parts = line.split(None, 8)
+    if len(parts) < 9 or not parts[0].startswith('-'):
+        return None
+
+    size, month, day, year_or_time, name = parts[4], parts[5], parts[6], parts[7], parts[8]
     try:
-        ftp.cwd(REMOTE_ORDERS_DIR)
-        files = ftp.nlst()  # list all files
-        logger.info(f"list of files in remote directory: {files}")
-        
-        csv_files = [file for file in files if file.endswith('.csv')] #locate the csv files
-        
-        if not csv_files:
-            # sys.exit(0)  # exit if no csv files are found
-            return
-
-        for file_name in csv_files:
-            local_file_path = os.path.join(LOCAL_ORDERS_DIR, file_name)
-            with open(local_file_path, 'wb') as local_file:
-                ftp.retrbinary(f'RETR {file_name}', local_file.write)
-            downloaded_files.append(file_name)
-            logger.info(f"downloaded: {file_name}")
-
-        return downloaded_files
+        if ':' in year_or_time:
+            # no year means within the last ~6 months: this year, unless that's in the future
+            now = time.gmtime()
+            mtime = calendar.timegm(time.strptime(f"{now.tm_year} {month} {day} {year_or_time}", '%Y %b %d %H:%M'))
+            if mtime > time.time() + 86400:
+                mtime = calendar.timegm(time.strptime(f"{now.tm_year - 1} {month} {day} {year_or_time}", '%Y %b %d %H:%M'))
+        else:
+            mtime = calendar.timegm(time.strptime(f"{year_or_time} {month} {day}", '%Y %b %d'))
+        return name, int(size), mtime
+    except ValueError:
+        return name, None, None
+
+@timed('ftp.list')
+def list_remote_files(ftp, remote_dir):
+    """{name: (size, mtime)} for the files in remote_dir, in one round trip (MLSD, or LIST if unsupported)"""
+    try:
+        return {
+            name: (int(facts['size']) if 'size' in facts else None,
+                   _parse_mlsd_time(facts['modify']) if 'modify' in facts else None)
+            for name, facts in ftp.mlsd(remote_dir, facts=['type', 'size', 'modify'])
+            if facts.get('type') == 'file'
+        }
+    except error_perm:
+        logger.info("server doesn't support MLSD. falling back to LIST")
     except Exception as e:
+        raise _ftp_error(f"error listing {remote_dir}", e) from e
+
+    lines = []
+    try:
+        ftp.retrlines(f'LIST {remote_dir}', lines.append)
+    except Exception as e:
+        raise _ftp_error(f"error listing {remote_dir}", e) from e
+    files = {}
+    for line in lines:
+        parsed = _parse_list_line(line)
+        if parsed:
+            name, size, mtime = parsed
+            files[name] = (size, mtime)
+    return files
+
+def _is_same_local_file(local_path, size, mtime):
+    if size is None or mtime is None or not os.path.isfile(local_path):
+        return False
+    stat = os.stat(local_path)
+    return stat.st_size == size and int(stat.st_mtime) == int(mtime)
+
+def _remote_size(ftp, remote_path):
+    """size in bytes, or None if the file isn't there or the server has no SIZE"""
+    try:
+        ftp.voidcmd('TYPE I')  # some servers only answer SIZE in binary mode
+        return ftp.size(remote_path)
+    except error_perm:
+        return None
+
+def _check_size(actual, expected, what):
+    if FTP_VERIFY_SIZE and actual is not None and expected is not None and actual != expected:
+        # most likely cut short -- worth another go on a fresh connection
+        raise FTPTransferError(f"{what} is {actual} bytes, expected {expected}", transient=True)
+
+def download_file(ftp, remote_path, local_path, size=None, mtime=None):
+    """RETR remote_path into local_path by way of local_path.part, renamed into place when complete.
+
+    a .part left by a dropped connection earlier in this run is continued with REST instead of
+    starting over (it's stamped with the remote modify time so a different file is never appended to).
+    """
+    remote_dir, name = posixpath.split(remote_path)
+    partial_path = f"{local_path}.part"
+    offset = 0
+    if mtime is not None and size and os.path.isfile(partial_path):
+        stat = os.stat(partial_path)
+        if int(stat.st_mtime) == int(mtime) and stat.st_size < size:
+            offset = stat.st_size
+            logger.info(f"resuming download of {name} at byte {offset}")
+    try:
+        if remote_dir:
+            ftp.cwd(remote_dir)
+        with span('ftp.download', file=name, bytes=size, resumed_at=offset), open(partial_path, 'ab' if offset else 'wb') as local_file:
+            ftp.retrbinary(f'RETR {name}', local_file.write, FTP_BLOCKSIZE, rest=offset or None)
+        try:
+            _check_size(os.path.getsize(partial_path), size, f"downloaded {name}")
+        except FTPTransferError:
+            os.remove(partial_path)  # can't tell which part is wrong -- start over
+            raise
+        os.replace(partial_path, local_path)  # never leave a half-written file behind
+
+        # stamp the remote time on the local copy so the next listing can tell it's the same file
+        if mtime is not None:
+            os.utime(local_path, (mtime, mtime))
+    except Exception as e:
+        if mtime is not None and os.path.isfile(partial_path):
+            os.utime(partial_path, (mtime, mtime))  # lets a retry pick up from here
+        if isinstance(e, FTPTransferError):
+            raise
+        raise _ftp_error(f"error downloading {remote_path}", e) from e
+
+def _download_one(ftp, file_name, size, mtime):
+    try:
+        download_file(ftp, f"{REMOTE_ORDERS_DIR}/{file_name}", os.path.join(LOCAL_ORDERS_DIR, file_name), size, mtime)
+        logger.info(f"downloaded: {file_name}")
+        return file_name
+    except FTPTransferError as e:
+        logger.error(f"order file transfer failed: {e}")
+        raise
+
+@timed('ftp.download_files')
+def download_files(ftp, connections=FTP_DOWNLOAD_CONNECTIONS):
+    """download every .csv in REMOTE_ORDERS_DIR to LOCAL_ORDERS_DIR and return their names.
+
+    files already present locally with the same size and modify time aren't transferred again, but
+    are still returned since they haven't been archived/uploaded yet. the rest download in parallel
+    over `connections` pooled connections.
+    """
+    try:
+        remote_files = list_remote_files(ftp, REMOTE_ORDERS_DIR)
+        logger.info(f"list of files in remote directory: {list(remote_files)}")
+    except FTPTransferError as e:
         logger.error(f"error during file download: {e}")
-    return []
+        raise
+
+    csv_files = sorted(name for name in remote_files if name.endswith('.csv')) #locate the csv files
+    if not csv_files:
+        return []
+
+    to_download = []
+    for file_name in csv_files:
+        size, mtime = remote_files[file_name]
+        if _is_same_local_file(os.path.join(LOCAL_ORDERS_DIR, file_name), size, mtime):
+            logger.info(f"already downloaded, skipping transfer: {file_name}")
+        else:
+            to_download.append(file_name)
+
+    # leave one pool slot for the listing connection we're holding
+    workers = min(connections, ftp_pool.max_size - 1, len(to_download))
+    if workers <= 1:
+        for file_name in to_download:
+            _download_one(ftp, file_name, *remote_files[file_name])
+        return csv_files
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ftp-download') as executor:
+        futures = [
+            executor.submit(ftp_pool.run, _download_one, file_name, *remote_files[file_name])
+            for file_name in to_download
+        ]
+        for future in futures:
+            future.result()  # re-raise the first failed transfer
+
+    return csv_files
+
+def download_order_file(ftp, file_name, size=None, mtime=None):
+    """download one order file unless we already have this exact copy"""
+    if _is_same_local_file(os.path.join(LOCAL_ORDERS_DIR, file_name), size, mtime):
+        logger.info(f"already downloaded, skipping transfer: {file_name}")
+    else:
+        _download_one(ftp, file_name, size, mtime)
 
 def delete_files_on_ftp(ftp, files):
     try:
@@ -73,18 +349,79 @@ def delete_files_on_ftp(ftp, files):
             logger.info(f"deleted file from remote directory: {file_name}")
     except Exception as e:
         logger.error(f"error deleting files on FTP: {e}")
-        sys.exit(1)
+        raise _ftp_error("error deleting files on FTP", e) from e
+
+# remote temp file -> the upload that wrote it (this run only), so a retry knows it may append to it
+_partial_uploads = {}
+_partial_uploads_lock = threading.Lock()
 
 def upload_files(ftp, local_file_path, remote_file_name):
+    """upload a local file to remote_file_name (a full path like /in/inventory/shopify.csv).
+    a pool retry after a dropped connection resumes where the last attempt stopped"""
+    stat = os.stat(local_file_path)
+    with open(local_file_path, 'rb') as local_file:
+        return upload_fileobj(ftp, local_file, remote_file_name,
+                              resume_key=(os.path.abspath(local_file_path), stat.st_size, stat.st_mtime_ns))
+
+def _rename_into_place(ftp, temp_name, name):
+    try:
+        ftp.rename(temp_name, name)
+    except error_perm:
+        # some servers won't rename over an existing file
+        ftp.delete(name)
+        ftp.rename(temp_name, name)
+
+def upload_fileobj(ftp, fileobj, remote_file_name, resume_key=None):
+    """upload any readable binary file object (e.g. an in-memory buffer) to remote_file_name.
+
+    the data goes to a hidden .part name in the same directory and is only renamed into place
+    once the server's SIZE matches what was sent, so nothing downstream sees half a file. with a
+    resume_key (and a seekable fileobj) a second call for the same key APPEs to what the first left.
+    returns the size of the uploaded file.
+    """
+    remote_dir, name = posixpath.split(remote_file_name)
+    temp_name = f".{name}.part"
+    temp_key = posixpath.join(remote_dir, temp_name)
     try:
-        ftp.cwd(REMOTE_INVENTORY_DIR)
-        with open(local_file_path, 'rb') as local_file:
-            ftp.storbinary(f'STOR {remote_file_name}', local_file)
+        if remote_dir:
+            ftp.cwd(remote_dir)
+
+        with _partial_uploads_lock:
+            resumable = resume_key is not None and _partial_uploads.get(temp_key) == resume_key
+            _partial_uploads[temp_key] = resume_key
+        offset = (_remote_size(ftp, temp_name) or 0) if resumable else 0
+        if offset:
+            fileobj.seek(offset)
+            logger.info(f"resuming upload of {name} at byte {offset}")
+
+        sent = [offset]
+        def count(block):
+            sent[0] += len(block)
+
+        with span('ftp.upload', file=remote_file_name, resumed_at=offset) as attrs:
+            ftp.storbinary(f"{'APPE' if offset else 'STOR'} {temp_name}", fileobj, FTP_BLOCKSIZE, callback=count)
+            attrs['bytes'] = sent[0]
+        try:
+            _check_size(_remote_size(ftp, temp_name), sent[0], f"uploaded {remote_file_name}")
+        except FTPTransferError:
+            with _partial_uploads_lock:
+                _partial_uploads.pop(temp_key, None)  # don't append to a bad temp file
+            raise
+        _rename_into_place(ftp, temp_name, name)
+
+        with _partial_uploads_lock:
+            _partial_uploads.pop(temp_key, None)
+        return sent[0]
     except Exception as e:
         logger.error(f"error during file upload: {e}")
-        sys.exit(1)
+        if isinstance(e, FTPTransferError):
+            raise
+        raise _ftp_error(f"error uploading {remote_file_name}", e) from e
 
-def archive_files_on_ftp(ftp, files):
+@timed('ftp.archive')
+def archive_files_on_ftp(ftp, files, on_archived=None):
+   """move files from /out/orders to the archive dir. on_archived(file_name) is called right after
+   each file's own rename, so a failure halfway still leaves a record of the ones that moved"""
    try:
        try:
            ftp.cwd(REMOTE_ORDER_ARCHIVE_DIR) # cd to dir
@@ -93,8 +430,29 @@ def archive_files_on_ftp(ftp, files):
 
        ftp.cwd(REMOTE_ORDERS_DIR)
        for file_name in files:
-           ftp.rename(file_name, f"{REMOTE_ORDER_ARCHIVE_DIR}/{file_name}") #move files from orders dir to archive dir
+           archive_path = f"{REMOTE_ORDER_ARCHIVE_DIR}/{file_name}"
+           try:
+               ftp.rename(file_name, archive_path) #move files from orders dir to archive dir
+           except error_perm:
+               # already moved by an earlier attempt that lost its connection -- only if it's gone from
+               # /out/orders (an older file of the same name may well be in the archive already)
+               if _remote_exists(ftp, f"{REMOTE_ORDERS_DIR}/{file_name}"):
+                   raise
            logger.info(f"archived file on FTP: {file_name}")
+           if on_archived:
+               on_archived(file_name)
    except Exception as e:
        logger.error(f"error archiving files on FTP: {e}")
-       sys.exit(1)
\ No newline at end of file
+       raise _ftp_error("error archiving files on FTP", e) from e
+
+def _remote_exists(ftp, remote_path):
+    """whether remote_path is in its directory's listing. not SIZE: some servers refuse it in ascii mode
+    or for any file, and that error looks just like a missing file"""
+    remote_dir, name = posixpath.split(remote_path)
+    try:
+        names = ftp.nlst(remote_dir or '.')
+    except error_perm as e:
+        if str(e).startswith('550'):
+            return False  # some servers answer an empty directory with 550
+        raise
+    return name in {posixpath.basename(entry) for entry in names}
\ No newline at end of file
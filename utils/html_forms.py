@@ -0,0 +1,85 @@
+from html.parser import HTMLParser
+
+class _FormParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.forms = []
+        self.text_by_class = {}
+        self._form = None
+        self._class_stack = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {k: (v or '') for k, v in attrs}
+        classes = attrs.get('class', '').split()
+
+        if tag == 'form':
+            self._form = {
+                'action': attrs.get('action', ''),
+                'method': attrs.get('method', 'get').lower(),
+                'id': attrs.get('id', ''),
+                'fields': [],
+            }
+            self.forms.append(self._form)
+        elif tag in ('input', 'button', 'select', 'textarea') and self._form is not None:
+            self._form['fields'].append({
+                'tag': tag,
+                'name': attrs.get('name', ''),
+                'value': attrs.get('value', ''),
+                'type': attrs.get('type', 'submit' if tag == 'button' else 'text').lower(),
+                'id': attrs.get('id', ''),
+                'classes': classes,
+            })
+
+        if tag not in ('input', 'br', 'img', 'meta', 'link', 'hr'):
+            self._class_stack.append(classes)
+
+    def handle_endtag(self, tag):
+        if tag == 'form':
+            self._form = None
+        if tag not in ('input', 'br', 'img', 'meta', 'link', 'hr') and self._class_stack:
+            self._class_stack.pop()
+
+    def handle_data(self, data):
+        for classes in self._class_stack:
+            for cls in classes:
+                self.text_by_class.setdefault(cls, []).append(data)
+
+def parse_page(html):
+    """parse an html page into its forms and the text found under each css class"""
+    parser = _FormParser()
+    parser.feed(html)
+    parser.close()
+    return parser
+
+def find_form(page, field_id=None, field_class=None):
+    """return the first form containing a field with the given id or class"""
+    for form in page.forms:
+        for field in form['fields']:
+            if field_id and field['id'] == field_id:
+                return form, field
+            if field_class and field_class in field['classes']:
+                return form, field
+    return None, None
+
+def unsupported_fields(form):
+    """named fields whose value form_data() can't know: selects, textareas (the selected option and the
+    text aren't parsed) and checkboxes/radio buttons (nor is whether they're checked)"""
+    return [
+        field['name'] for field in form['fields']
+        if field['name'] and (field['tag'] in ('select', 'textarea') or field['type'] in ('checkbox', 'radio'))
+    ]
+
+def form_data(form, submitter=None):
+    """build the payload a browser would send for this form (hidden/text fields plus the clicked button).
+    only right for forms without unsupported_fields()"""
+    data = {}
+    for field in form['fields']:
+        if not field['name'] or field['type'] in ('file', 'submit', 'button', 'image', 'reset'):
+            continue
+        if field['type'] in ('checkbox', 'radio'):
+            continue
+        data[field['name']] = field['value']
+
+    if submitter and submitter['name']:
+        data[submitter['name']] = submitter['value']
+    return data
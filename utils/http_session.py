@@ -0,0 +1,125 @@
+import os
+import logging
+import requests
+from urllib.parse import urljoin
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from utils.html_forms import parse_page, find_form, form_data
+from utils.session_cookies import SESSION_COOKIE_FILE, load_session_cookies, save_session_cookies
+from utils.metrics import span, timed
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 4))
+HTTP_TIMEOUT = int(os.getenv('HTTP_TIMEOUT', 60)) # seconds
+# before logging in, check the saved cookies with one request to a page that needs a login
+SESSION_PROBE = os.getenv('SESSION_PROBE', 'true').lower() in ('1', 'true', 'yes')
+SESSION_PROBE_TIMEOUT = float(os.getenv('SESSION_PROBE_TIMEOUT', 5)) # seconds
+# field names that only show up on a login form
+# only a page showing this counts as logged in -- the file input on UPLOAD_URL. set it to something on
+# SESSION_PROBE_URL's page if that points elsewhere
+SESSION_PROBE_MARKER = os.getenv('SESSION_PROBE_MARKER', 'id="formFile"')
+LOGIN_FORM_MARKERS = ('name="user"', "name='user'", 'name="login_email"', "name='login_email'")
+PROBE_MAX_BYTES = 256 * 1024
+
+def get_http_session(cookie_file=SESSION_COOKIE_FILE, cookies=None):
+    """pooled requests session seeded with the browser's saved vendor cookies (or these selenium-style cookies)"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.cookie_file = cookie_file  # so a re-login saves back to the same file
+
+    for cookie in load_session_cookies(cookie_file) if cookies is None else cookies:
+        session.cookies.set(
+            cookie['name'],
+            cookie['value'],
+            domain=cookie.get('domain'),
+            path=cookie.get('path', '/'),
+        )
+    return session
+
+def probe_session(session, url=None, method='GET'):
+    """one request to an authenticated page to see if the session's cookies are still logged in.
+
+    True if they are, False if the site wants a login (a redirect, 401/403 or a login form), None if it
+    couldn't tell (network error, 5xx, or a page with neither the login form nor SESSION_PROBE_MARKER).
+    url defaults to SESSION_PROBE_URL, then UPLOAD_URL. with method='HEAD' (for a file like the
+    inventory feed) an html answer counts as the login page.
+    """
+    url = url or os.getenv('SESSION_PROBE_URL') or os.getenv('UPLOAD_URL')
+    with span('session.probe', method=method) as attrs:
+        try:
+            response = session.request(method, url, timeout=SESSION_PROBE_TIMEOUT, allow_redirects=False, stream=True)
+        except requests.RequestException as e:
+            logger.info(f"session probe failed: {e}")
+            attrs['result'] = 'unknown'
+            return None
+
+        with response:
+            if response.is_redirect or response.status_code in (401, 403):
+                valid = False
+            elif not response.ok:
+                valid = None
+            elif 'html' not in response.headers.get('Content-Type', ''):
+                valid = True
+            elif method == 'HEAD':
+                valid = False
+            else:
+                page = response.raw.read(PROBE_MAX_BYTES, decode_content=True).decode(response.encoding or 'utf-8', 'replace')
+                if any(marker in page for marker in LOGIN_FORM_MARKERS):
+                    valid = False
+                elif SESSION_PROBE_MARKER in page:
+                    valid = True
+                else:
+                    valid = None  # some other page (an error or maintenance page) -- don't trust the cookies
+        attrs['result'] = {True: 'valid', False: 'expired', None: 'unknown'}[valid]
+    logger.info(f"session probe on {url}: {attrs['result']} ({response.status_code})")
+    return valid
+
+def save_http_cookies(session, cookie_file=None):
+    cookie_file = cookie_file or getattr(session, 'cookie_file', SESSION_COOKIE_FILE)
+    # same format selenium uses so the browser can pick these up too
+    cookies = []
+    for c in session.cookies:
+        cookie = {'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path, 'secure': c.secure}
+        if c.expires:
+            cookie['expiry'] = c.expires
+        cookies.append(cookie)
+    save_session_cookies(cookies, cookie_file)
+
+@timed('http.login')
+def http_login(session, username=None, password=None):
+    """submit the vendor login form (user/pw/submitBtn) without a browser"""
+    login_url = os.getenv('LOGIN_URL')
+    logger.info("logging into vendor site over http...")
+
+    response = session.get(login_url, timeout=HTTP_TIMEOUT)
+    if not response.ok:
+        logger.error(f"could not load login page: {response.status_code}")
+        return False
+
+    page = parse_page(response.text)
+    form, _ = find_form(page, field_id='submitBtn')
+    if form is None:
+        logger.error("login form not found on login page")
+        return False
+
+    data = form_data(form)
+    data['user'] = username or os.getenv('LOGIN_USERNAME')
+    data['pw'] = password or os.getenv('LOGIN_PASSWORD')
+
+    response = session.post(urljoin(response.url, form['action']), data=data, timeout=HTTP_TIMEOUT)
+    if not response.ok or 'Welcome' not in response.text:
+        logger.error("http login failed")
+        return False
+
+    logger.info("http login successful")
+    save_http_cookies(session)
+    return True
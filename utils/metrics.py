@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import uuid
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from utils.run_state import BASE_DIR
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# one JSON line per finished span; set to '' to turn off
+METRICS_SPANS_FILE = os.getenv('METRICS_SPANS_FILE', os.path.join(BASE_DIR, 'metrics', 'spans.jsonl'))
+METRICS_SPANS_MAX_BYTES = int(os.getenv('METRICS_SPANS_MAX_BYTES', 20 * 1024 * 1024)) # rotated to spans.jsonl.1 past this
+# prometheus textfile (e.g. in node_exporter's --collector.textfile.directory); set to '' to turn off
+METRICS_TEXTFILE = os.getenv('METRICS_TEXTFILE', os.path.join(BASE_DIR, 'metrics', 'perfumebot.prom'))
+
+RUN_ID = uuid.uuid4().hex[:12]  # ties together the spans of one process
+
+_lock = threading.Lock()
+_local = threading.local()
+_totals = {}   # span name -> {'count', 'errors', 'seconds', 'last_seconds'}
+_retries = {}  # operation -> retry count
+
+def _write_span(record):
+    if not METRICS_SPANS_FILE:
+        return
+    try:
+        os.makedirs(os.path.dirname(METRICS_SPANS_FILE), exist_ok=True)
+        if os.path.exists(METRICS_SPANS_FILE) and os.path.getsize(METRICS_SPANS_FILE) > METRICS_SPANS_MAX_BYTES:
+            os.replace(METRICS_SPANS_FILE, f"{METRICS_SPANS_FILE}.1")
+        with open(METRICS_SPANS_FILE, 'a') as f:
+            f.write(json.dumps(record, default=str) + '\n')
+    except OSError as e:
+        logger.debug(f"could not write span: {e}")
+
+@contextmanager
+def span(name, **attrs):
+    """time a block. nested spans record their parent, and a block that raises is marked as an error"""
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    span_id = uuid.uuid4().hex[:8]
+    parent = stack[-1] if stack else None
+    stack.append(span_id)
+
+    started = time.time()
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield attrs  # the block can add attributes, e.g. attrs['files'] = 3
+    except BaseException as e:
+        status = 'error'
+        attrs.setdefault('error', f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+        with _lock:
+            totals = _totals.setdefault(name, {'count': 0, 'errors': 0, 'seconds': 0.0, 'last_seconds': 0.0})
+            totals['count'] += 1
+            totals['errors'] += status == 'error'
+            totals['seconds'] += seconds
+            totals['last_seconds'] = seconds
+            _write_span({
+                'run': RUN_ID, 'span': name, 'id': span_id, 'parent': parent,
+                'start': round(started, 3), 'seconds': round(seconds, 4), 'status': status,
+                'thread': threading.current_thread().name, **attrs,
+            })
+
+def timed(name):
+    """decorator version of span()"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count_retry(operation):
+    with _lock:
+        _retries[operation] = _retries.get(operation, 0) + 1
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+def write_textfile(path=None):
+    """write totals so far in prometheus text format. the file is replaced atomically so the
+    collector never reads half of it"""
+    path = METRICS_TEXTFILE if path is None else path
+    if not path:
+        return
+    with _lock:
+        totals = {name: dict(values) for name, values in _totals.items()}
+        retries = dict(_retries)
+
+    lines = [
+        '# HELP perfumebot_span_seconds_total Time spent in each span.',
+        '# TYPE perfumebot_span_seconds_total counter',
+        *(f'perfumebot_span_seconds_total{{span="{_label(n)}"}} {v["seconds"]:.4f}' for n, v in sorted(totals.items())),
+        '# HELP perfumebot_span_count_total Number of times each span ran.',
+        '# TYPE perfumebot_span_count_total counter',
+        *(f'perfumebot_span_count_total{{span="{_label(n)}"}} {v["count"]}' for n, v in sorted(totals.items())),
+        '# HELP perfumebot_span_errors_total Number of spans that ended in an error.',
+        '# TYPE perfumebot_span_errors_total counter',
+        *(f'perfumebot_span_errors_total{{span="{_label(n)}"}} {v["errors"]}' for n, v in sorted(totals.items())),
+        '# HELP perfumebot_span_last_seconds Duration of the most recent run of each span.',
+        '# TYPE perfumebot_span_last_seconds gauge',
+        *(f'perfumebot_span_last_seconds{{span="{_label(n)}"}} {v["last_seconds"]:.4f}' for n, v in sorted(totals.items())),
+        '# HELP perfumebot_retries_total Retries by operation.',
+        '# TYPE perfumebot_retries_total counter',
+        *(f'perfumebot_retries_total{{operation="{_label(n)}"}} {v}' for n, v in sorted(retries.items())),
+        '# HELP perfumebot_last_write_timestamp_seconds When this file was written.',
+        '# TYPE perfumebot_last_write_timestamp_seconds gauge',
+        f'perfumebot_last_write_timestamp_seconds {time.time():.0f}',
+    ]
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"could not write metrics textfile {path}: {e}")
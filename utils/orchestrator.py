@@ -0,0 +1,69 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.metrics import span
+
+logger = logging.getLogger(__name__)
+
+def run_stage(name, func, timeout):
+    """run func in its own thread and give up waiting after `timeout` seconds.
+
+    returns {'stage', 'status' (ok/failed/timeout), 'seconds', 'error'}. a stage that times out
+    keeps running in the background (a hung chrome wait can't be interrupted) but nobody waits for it.
+    """
+    result = {'stage': name, 'status': 'timeout', 'seconds': None, 'error': None}
+
+    def target():
+        try:
+            with span(f"stage.{name}"):
+                ok = func()
+            result['status'] = 'failed' if ok is False else 'ok'
+        except Exception as e:
+            logger.error(f"stage '{name}' failed: {e}", exc_info=True)
+            result['status'] = 'failed'
+            result['error'] = str(e)
+
+    start = time.monotonic()
+    thread = threading.Thread(target=target, name=f"stage-{name}", daemon=True)
+    thread.start()
+    thread.join(timeout)
+    result['seconds'] = round(time.monotonic() - start, 1)
+
+    if thread.is_alive():
+        result['error'] = f"still running after {timeout}s"
+        logger.error(f"stage '{name}' timed out after {timeout}s")
+    else:
+        logger.info(f"stage '{name}' {result['status']} in {result['seconds']}s")
+    return result
+
+def run_lanes(lanes):
+    """run lanes in parallel; the stages inside one lane run in order.
+
+    lanes is a list of [(name, func, timeout), ...]. stages that share a resource (like the one
+    browser) go in the same lane. if a stage times out, the rest of its lane is skipped since the
+    shared resource may still be busy. returns {stage name: result} for every stage.
+    """
+    summary = {}
+
+    def run_lane(lane):
+        for index, (name, func, timeout) in enumerate(lane):
+            result = run_stage(name, func, timeout)
+            summary[name] = result
+            if result['status'] == 'timeout':
+                for later_name, _, _ in lane[index + 1:]:
+                    summary[later_name] = {'stage': later_name, 'status': 'skipped', 'seconds': 0,
+                                           'error': f"'{name}' timed out in the same lane"}
+                break
+
+    lanes = [lane for lane in lanes if lane]
+    if lanes:
+        with ThreadPoolExecutor(max_workers=len(lanes), thread_name_prefix='lane') as executor:
+            list(executor.map(run_lane, lanes))
+    return summary
+
+def format_run_summary(summary):
+    return '\n'.join(
+        f"{name}: {result['status']} ({result['seconds']}s)" + (f" - {result['error']}" if result['error'] else '')
+        for name, result in summary.items()
+    )
@@ -0,0 +1,176 @@
+import os
+import sys
+import time
+import sqlite3
+import hashlib
+import logging
+from contextlib import closing
+from dotenv import load_dotenv
+from utils.run_state import BASE_DIR
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# one row per order file: downloaded -> archived -> uploading -> submitted -> moved.
+# an upload that fails before the submit goes back to 'archived' and is retried next run. 'failed'
+# (submitted but no batch confirmed) and 'held' (the run died mid-upload) are never retried
+# automatically since the vendor may already have the batch -- check the site, then use the CLI below.
+# 'invalid' files failed the local checks in order_validation.py and sit in the quarantine dir.
+ORDER_LEDGER_FILE = os.getenv('ORDER_LEDGER_FILE', os.path.join(BASE_DIR, 'order_ledger.sqlite3'))
+
+DOWNLOADED, ARCHIVED, UPLOADING, SUBMITTED, MOVED = 'downloaded', 'archived', 'uploading', 'submitted', 'moved'
+FAILED, HELD, INVALID = 'failed', 'held', 'invalid'
+DONE_STATES = (SUBMITTED, MOVED)
+
+def _connect():
+    conn = sqlite3.connect(ORDER_LEDGER_FILE, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")  # the upload workers write while main reads
+    conn.execute("PRAGMA synchronous=FULL")  # a submitted batch must survive a crash right after
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS orders ("
+        " file_name TEXT PRIMARY KEY, sha256 TEXT, ftp_path TEXT, state TEXT NOT NULL,"
+        " upload_file TEXT, batch_number TEXT, error TEXT,"
+        " downloaded_at REAL, archived_at REAL, uploading_at REAL, submitted_at REAL, moved_at REAL)"
+    )
+    return conn
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def get_order(file_name):
+    with closing(_connect()) as conn:
+        row = conn.execute("SELECT * FROM orders WHERE file_name = ?", (file_name,)).fetchone()
+    return dict(row) if row else None
+
+def record_downloaded(file_name, local_path, ftp_path=None):
+    """record a freshly downloaded order file and return its state.
+
+    if this exact content was already submitted the row keeps its submitted/moved state, so the
+    caller knows not to upload it again. a file name that comes back with new content starts over.
+    """
+    sha256 = file_sha256(local_path)
+    with closing(_connect()) as conn, conn:
+        row = conn.execute("SELECT state, sha256 FROM orders WHERE file_name = ?", (file_name,)).fetchone()
+        # an invalid file that is put back unchanged is checked again rather than ignored
+        if row and row['sha256'] == sha256 and row['state'] not in (DOWNLOADED, INVALID):
+            if row['state'] in DONE_STATES:
+                logger.warning(f"ledger: {file_name} was already submitted, it won't be uploaded again")
+            return row['state']
+        if row:
+            logger.info(f"ledger: {file_name} came back with new content, tracking it as a new order")
+        conn.execute(
+            "INSERT OR REPLACE INTO orders (file_name, sha256, ftp_path, state, upload_file, downloaded_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (file_name, sha256, ftp_path, DOWNLOADED, file_name, time.time()),
+        )
+    return DOWNLOADED
+
+def record_archived(file_names):
+    with closing(_connect()) as conn, conn:
+        conn.executemany(
+            "UPDATE orders SET state = ?, archived_at = ? WHERE file_name = ? AND state = ?",
+            [(ARCHIVED, time.time(), file_name, DOWNLOADED) for file_name in file_names],
+        )
+
+def assign_upload(upload_file, source_files):
+    """remember which upload file (e.g. a merged batch) carries these order files"""
+    with closing(_connect()) as conn, conn:
+        conn.executemany(
+            "UPDATE orders SET upload_file = ? WHERE file_name = ?",
+            [(upload_file, file_name) for file_name in source_files],
+        )
+
+def mark_upload(upload_file, state, batch_number=None, error=None):
+    """move every order file behind upload_file to uploading/submitted/failed, or back to archived"""
+    column = {UPLOADING: 'uploading_at', SUBMITTED: 'submitted_at'}.get(state)
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            f"UPDATE orders SET state = ?, batch_number = COALESCE(?, batch_number), error = ?"
+            f"{f', {column} = {time.time()}' if column else ''} WHERE upload_file = ?",
+            (state, batch_number, error, upload_file),
+        )
+
+def record_invalid(file_name, error):
+    with closing(_connect()) as conn, conn:
+        conn.execute("UPDATE orders SET state = ?, error = ? WHERE file_name = ?", (INVALID, error, file_name))
+
+def record_moved(file_names):
+    with closing(_connect()) as conn, conn:
+        conn.executemany(
+            "UPDATE orders SET state = ?, moved_at = ? WHERE file_name = ?",
+            [(MOVED, time.time(), file_name) for file_name in file_names],
+        )
+
+def recover(local_dir):
+    """sort out what a previous run left behind in local_dir. returns
+    (files to upload, {file: batch} already submitted but not moved yet, files held after a crash mid-upload).
+
+    only 'archived' files are uploaded -- they are off the FTP but were never sent to the vendor.
+    """
+    to_upload, submitted, held = [], {}, []
+    with closing(_connect()) as conn, conn:
+        rows = conn.execute(
+            "SELECT file_name, state, batch_number FROM orders WHERE state IN (?, ?, ?, ?)",
+            (ARCHIVED, UPLOADING, SUBMITTED, MOVED),
+        ).fetchall()
+        for row in rows:
+            if not os.path.isfile(os.path.join(local_dir, row['file_name'])):
+                continue
+            if row['state'] == ARCHIVED:
+                to_upload.append(row['file_name'])
+            elif row['state'] == UPLOADING:
+                held.append(row['file_name'])
+            else:
+                submitted[row['file_name']] = row['batch_number']
+
+        # leftover merged-batch assignments from a run that stopped early don't apply any more
+        conn.executemany("UPDATE orders SET upload_file = file_name WHERE file_name = ?", [(f,) for f in to_upload])
+        conn.executemany("UPDATE orders SET state = ? WHERE file_name = ?", [(HELD, f) for f in held])
+
+    if to_upload:
+        logger.info(f"ledger: order files archived but not uploaded yet: {sorted(to_upload)}")
+    if submitted:
+        logger.info(f"ledger: order files already submitted, moving them now: {sorted(submitted)}")
+    if held:
+        logger.error(f"ledger: a previous run stopped while uploading {sorted(held)}. holding them until checked")
+    return sorted(to_upload), submitted, sorted(held)
+
+def has_unfinished(local_dir):
+    """True if an earlier run left order files in local_dir that recover() would pick up"""
+    with closing(_connect()) as conn:
+        rows = conn.execute(
+            "SELECT file_name FROM orders WHERE state IN (?, ?, ?)", (ARCHIVED, UPLOADING, SUBMITTED),
+        ).fetchall()
+    return any(os.path.isfile(os.path.join(local_dir, row['file_name'])) for row in rows)
+
+def _print_orders(states=None):
+    with closing(_connect()) as conn:
+        rows = conn.execute("SELECT * FROM orders ORDER BY COALESCE(downloaded_at, 0)").fetchall()
+    for row in rows:
+        if states and row['state'] not in states:
+            continue
+        updated = max(row[c] or 0 for c in ('downloaded_at', 'archived_at', 'uploading_at', 'submitted_at', 'moved_at'))
+        print(f"{row['file_name']:40s} {row['state']:10s} batch={row['batch_number'] or '-':8s} "
+              f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(updated))}  {row['error'] or ''}")
+
+if __name__ == '__main__':
+    # python -m utils.order_ledger                    list files that aren't moved yet (--all for everything)
+    # python -m utils.order_ledger retry FILE         upload FILE again next run (it's NOT on the vendor site)
+    # python -m utils.order_ledger done FILE BATCH    FILE did go through as BATCH, just move it next run
+    args = sys.argv[1:]
+    if args[:1] == ['retry'] and len(args) == 2:
+        with closing(_connect()) as conn, conn:
+            conn.execute("UPDATE orders SET state = ?, upload_file = file_name, error = NULL WHERE file_name = ?", (ARCHIVED, args[1]))
+    elif args[:1] == ['done'] and len(args) == 3:
+        with closing(_connect()) as conn, conn:
+            conn.execute("UPDATE orders SET state = ?, batch_number = ?, submitted_at = ? WHERE file_name = ?", (SUBMITTED, args[2], time.time(), args[1]))
+    elif args in ([], ['--all']):
+        _print_orders(None if args else (DOWNLOADED, ARCHIVED, UPLOADING, SUBMITTED, FAILED, HELD, INVALID))
+    else:
+        sys.exit("usage: python -m utils.order_ledger [--all | retry FILE | done FILE BATCH]")
@@ -0,0 +1,81 @@
+import os
+import time
+import logging
+import urllib.error
+import urllib.request
+from dotenv import load_dotenv
+from utils import order_ledger
+from utils.ftp_utils import ftp_pool, list_remote_files, REMOTE_ORDERS_DIR, LOCAL_ORDERS_DIR
+from utils.run_state import INVENTORY_STATE_FILE, INVENTORY_COOKIE_FILE, RUN_STATE_FILE, load_state
+from utils.session_cookies import load_session_cookies
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PRECHECK_TIMEOUT = float(os.getenv('PRECHECK_TIMEOUT', 5)) # seconds per request
+# push tracking at most this often; a bit under an hour so the hourly launchd run still does it every time.
+# measured from the start of the run that last pushed it, however long its orders stage took
+TRACKING_MIN_INTERVAL = int(os.getenv('TRACKING_MIN_INTERVAL', 3300)) # seconds
+
+def orders_pending():
+    """True if /out/orders has any .csv waiting, or the ledger has files an earlier run archived
+    but didn't finish (they're already off the FTP, so the listing alone would miss them)"""
+    try:
+        if order_ledger.has_unfinished(LOCAL_ORDERS_DIR):
+            return True
+    except Exception as e:
+        logger.warning(f"precheck: could not read the order ledger ({e}). assuming there is work")
+        return True
+    try:
+        files = ftp_pool.run(list_remote_files, REMOTE_ORDERS_DIR, retries=0)
+        return any(name.endswith('.csv') for name in files)
+    except Exception as e:
+        logger.warning(f"precheck: could not list FTP orders ({e}). assuming there is work")
+        return True
+
+def inventory_changed():
+    """False only when the vendor confirms the feed still matches our last download (304 or same ETag)
+    and that download also made it to the FTP"""
+    state = load_state(INVENTORY_STATE_FILE)
+    if not state.get('etag') and not state.get('last_modified'):
+        return True
+    if state.get('sha256') != state.get('uploaded_sha256'):
+        logger.info("precheck: the last inventory download was never pushed to the FTP. running it again")
+        return True
+
+    request = urllib.request.Request(os.getenv('INVENTORY_FILE_URL'), method='HEAD')
+    if state.get('etag'):
+        request.add_header('If-None-Match', state['etag'])
+    if state.get('last_modified'):
+        request.add_header('If-Modified-Since', state['last_modified'])
+    cookies = load_session_cookies(INVENTORY_COOKIE_FILE)
+    if cookies:
+        request.add_header('Cookie', '; '.join(f"{c['name']}={c['value']}" for c in cookies))
+
+    try:
+        with urllib.request.urlopen(request, timeout=PRECHECK_TIMEOUT) as response:
+            etag = response.headers.get('ETag')
+            return not (etag and etag == state.get('etag'))
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return False
+        logger.info(f"precheck: inventory HEAD returned {e.code}. assuming it changed")
+    except Exception as e:
+        logger.info(f"precheck: inventory HEAD failed ({e}). assuming it changed")
+    return True
+
+def tracking_due():
+    last_run = load_state(RUN_STATE_FILE).get('tracking_last_success', 0)
+    return time.time() - last_run >= TRACKING_MIN_INTERVAL
+
+def precheck():
+    """cheap look for work before anything heavy is imported. returns {'orders': bool, 'inventory': bool, 'tracking': bool}"""
+    start = time.monotonic()
+    work = {
+        'orders': orders_pending(),
+        'inventory': inventory_changed(),
+        'tracking': tracking_due(),
+    }
+    logger.info(f"precheck finished in {time.monotonic() - start:.2f}s: {work}")
+    return work
@@ -0,0 +1,33 @@
+import os
+import json
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# remembers the inventory feed's ETag/Last-Modified and content hash between runs
+INVENTORY_STATE_FILE = os.getenv('INVENTORY_STATE_FILE', os.path.join(BASE_DIR, 'inventory_state.json'))
+# cookies from the inventory site's requests login
+INVENTORY_COOKIE_FILE = os.getenv('INVENTORY_COOKIE_FILE', os.path.join(BASE_DIR, 'inventory_cookies.json'))
+# when each stage last finished successfully
+RUN_STATE_FILE = os.getenv('RUN_STATE_FILE', os.path.join(BASE_DIR, 'run_state.json'))
+
+def load_state(state_file):
+    if not os.path.isfile(state_file):
+        return {}
+    try:
+        with open(state_file) as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"could not read state file {state_file}: {e}")
+        return {}
+
+def save_state(state, state_file):
+    tmp_file = f"{state_file}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_file, state_file)  # atomic so a crash never leaves half a file
@@ -0,0 +1,84 @@
+import time
+import signal
+import logging
+import threading
+from utils.metrics import span, write_textfile
+
+logger = logging.getLogger(__name__)
+
+class Job:
+    def __init__(self, name, interval, func, lock=None):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.lock = lock  # shared with other jobs that can't run at the same time (e.g. one browser)
+        self.next_run = 0
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+class Scheduler:
+    """runs each job on its own interval in a background thread.
+
+    a job that is still running when it comes due again is skipped rather than stacked,
+    and SIGTERM/SIGINT stop scheduling and wait for running jobs to finish.
+    """
+
+    def __init__(self, tick=1.0):
+        self.jobs = []
+        self.tick = tick
+        self.stopping = threading.Event()
+
+    def add_job(self, name, interval, func, lock=None):
+        self.jobs.append(Job(name, interval, func, lock))
+
+    def _run_job(self, job):
+        start = time.monotonic()
+        try:
+            if job.lock:
+                with job.lock, span(f"job.{job.name}"):
+                    job.func()
+            else:
+                with span(f"job.{job.name}"):
+                    job.func()
+            logger.info(f"job '{job.name}' finished in {time.monotonic() - start:.1f}s")
+        except Exception as e:
+            logger.error(f"job '{job.name}' failed: {e}", exc_info=True)
+        finally:
+            write_textfile()
+
+    def _start_due_jobs(self):
+        now = time.monotonic()
+        for job in self.jobs:
+            if now < job.next_run:
+                continue
+            job.next_run = now + job.interval
+            if job.running:
+                logger.warning(f"job '{job.name}' is still running from last time. skipping this run")
+                continue
+            job.thread = threading.Thread(target=self._run_job, args=(job,), name=f"job-{job.name}", daemon=True)
+            job.thread.start()
+
+    def stop(self, signum=None, frame=None):
+        if not self.stopping.is_set():
+            logger.info("shutdown requested. finishing running jobs...")
+        self.stopping.set()
+
+    def run_forever(self, shutdown_timeout=300):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        logger.info(f"scheduler started: {', '.join(f'{job.name} every {job.interval}s' for job in self.jobs)}")
+
+        while not self.stopping.is_set():
+            self._start_due_jobs()
+            self.stopping.wait(self.tick)
+
+        deadline = time.monotonic() + shutdown_timeout
+        for job in self.jobs:
+            if job.running:
+                job.thread.join(max(0, deadline - time.monotonic()))
+                if job.running:
+                    logger.warning(f"job '{job.name}' did not finish before shutdown")
+        logger.info("scheduler stopped")
@@ -3,8 +3,11 @@ import time
 import logging
 from dotenv import load_dotenv
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from utils.metrics import span, count_retry
+from utils.wait_policy import wait_until, wait_for_any, backoff_delay
+from utils.selenium_setup import load_page
+from utils.http_session import SESSION_PROBE, get_http_session, probe_session
 
 load_dotenv()
 
@@ -15,61 +18,69 @@ logging.basicConfig(
 )
 
 MAX_RETRIES = 3
-RETRY_DELAY = 5 # seconds
+RETRY_DELAY = 5 # seconds before the first retry, doubling (with jitter) after that
 
 def perfume_selenium_login(driver, username, password, short_wait_time=5, long_wait_time=30):
-    short_wait = WebDriverWait(driver, short_wait_time)
-    long_wait = WebDriverWait(driver, long_wait_time)
+    # the browser may still hold a good session for the page it's on -- one request says so
+    cookies = driver.get_cookies() if SESSION_PROBE else []
+    if cookies:
+        with get_http_session(cookies=cookies) as http:
+            logged_in = probe_session(http)
+        if logged_in:
+            logger.info("browser session is still logged in. skipping login.")
+            return True
 
     attempt = 0
     while attempt < MAX_RETRIES:
         try:
-            logger.info(f"attempt {attempt + 1} of {MAX_RETRIES}: navigating to PerfumeShop login page...")
-            driver.get(os.getenv('LOGIN_URL'))
+            with span('login.attempt', attempt=attempt + 1):
+                logger.info(f"attempt {attempt + 1} of {MAX_RETRIES}: navigating to PerfumeShop login page...")
+                load_page(driver, os.getenv('LOGIN_URL'), 'login')
 
-            # click the 'ok' button if it appears (preious session timeout)
-            try:
-                logger.info("checking for 'ok' button...")
-                okay_button = short_wait.until(
-                    EC.presence_of_element_located((By.CLASS_NAME, 'swal2-confirm'))
-                )
-                logger.info("'ok' button found. clicking it now...")
-                okay_button.click()
-            except Exception:
-                logger.info("'ok' button not found or not needed. continuing...")
+                # click the 'ok' button if it appears (preious session timeout). whichever shows up
+                # first wins, so a normal login doesn't sit out the popup's timeout
+                logger.info("waiting for the 'ok' popup or the username field...")
+                shown, element = wait_for_any(driver, 'login.form', {
+                    'popup': EC.presence_of_element_located((By.CLASS_NAME, 'swal2-confirm')),
+                    'form': EC.presence_of_element_located((By.NAME, 'user')),
+                }, short_wait_time + long_wait_time)
+                if shown == 'form':
+                    element = next((b for b in driver.find_elements(By.CLASS_NAME, 'swal2-confirm') if b.is_displayed()), None)
+                if element is not None:
+                    logger.info("'ok' button found. clicking it now...")
+                    element.click()
+                else:
+                    logger.info("'ok' button not found or not needed. continuing...")
 
-            # login flow
-            logger.info("waiting for username field...")
-            username_field = long_wait.until(
-                EC.presence_of_element_located((By.NAME, 'user'))
-            )
+                # login flow
+                logger.info("waiting for username field...")
+                username_field = wait_until(driver, 'login.user', EC.presence_of_element_located((By.NAME, 'user')), long_wait_time)
 
-            logger.info("found username field. waiting for password field...")
-            password_field = long_wait.until(
-                EC.presence_of_element_located((By.NAME, 'pw'))
-            )
+                logger.info("found username field. waiting for password field...")
+                password_field = wait_until(driver, 'login.pw', EC.presence_of_element_located((By.NAME, 'pw')), long_wait_time)
 
-            logger.info("entering username and password...")
-            username_field.send_keys(username)
-            password_field.send_keys(password)
+                logger.info("entering username and password...")
+                username_field.send_keys(username)
+                password_field.send_keys(password)
 
-            logger.info("clicking login button...")
-            login_button = driver.find_element(By.ID, 'submitBtn')
-            login_button.click()
+                logger.info("clicking login button...")
+                login_button = driver.find_element(By.ID, 'submitBtn')
+                login_button.click()
 
-            logger.info("login submitted. Waiting for login confirmation message...")
-            long_wait.until(
-                EC.text_to_be_present_in_element((By.TAG_NAME, "body"), "Welcome, Gabrielle")
-            )
-            logger.info("successfully logged in.")
-            return True
+                logger.info("login submitted. Waiting for login confirmation message...")
+                wait_until(driver, 'login.welcome',
+                    EC.text_to_be_present_in_element((By.TAG_NAME, "body"), "Welcome, Gabrielle"), long_wait_time)
+                logger.info("successfully logged in.")
+                return True
 
         except Exception as e:
             logger.error(f"attempt {attempt + 1} failed: {e}", exc_info=True)
             attempt += 1
             if attempt < MAX_RETRIES:
-                logger.info(f"retrying login in {RETRY_DELAY} seconds...")
-                time.sleep(RETRY_DELAY)
+                delay = backoff_delay(attempt - 1, RETRY_DELAY)
+                logger.info(f"retrying login in {delay:.1f} seconds...")
+                count_retry('login')
+                time.sleep(delay)
 
     logger.error(f"all {MAX_RETRIES} attempts failed. no more retires.")
     return False
\ No newline at end of file
@@ -0,0 +1,178 @@
+import os
+import shutil
+import logging
+import tempfile
+from dotenv import load_dotenv
+from utils.session_cookies import SESSION_COOKIE_FILE, load_session_cookies, save_session_cookies
+from utils.run_state import BASE_DIR
+from utils.metrics import timed
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+)
+
+# each session keeps its chrome profile (http cache included) in a subdirectory here between runs.
+# empty starts every browser with a fresh temporary profile
+CHROME_PROFILE_DIR = os.getenv('CHROME_PROFILE_DIR', os.path.join(BASE_DIR, 'chrome_profiles'))
+
+class SeleniumSession:
+    """One logged-in headless browser shared by every stage of a run.
+
+    The driver is only started the first time a stage asks for it, and the
+    login cookies are written to disk so the next run can skip the login
+    form while they are still valid. Selenium itself isn't imported until
+    then either, so creating a session is free for runs with no browser work.
+    """
+
+    def __init__(self, username=None, password=None, cookie_file=SESSION_COOKIE_FILE, profile='main'):
+        self.username = username or os.getenv('LOGIN_USERNAME')
+        self.password = password or os.getenv('LOGIN_PASSWORD')
+        self.cookie_file = cookie_file
+        # a profile can only be open in one browser at a time, so every session needs its own name
+        self.profile_dir = os.path.join(CHROME_PROFILE_DIR, profile) if CHROME_PROFILE_DIR else None
+        self.driver = None
+        self.logged_in = False
+        self.download_dir = None
+        self.stage = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get_driver(self, stage=None):
+        """return the authenticated driver, starting and logging in on first use. returns None if login fails.
+
+        stage ('orders', 'tracking') picks which resources the browser blocks, see CHROME_BLOCK_<STAGE>
+        """
+        if self.driver is None:
+            from utils.selenium_setup import get_headless_driver
+
+            # every run gets its own empty download dir so we know exactly which file is ours
+            self.download_dir = tempfile.mkdtemp(prefix='perfumeshopbot-downloads-')
+            self.driver = get_headless_driver(download_dir=self.download_dir, profile_dir=self.profile_dir)
+            self.stage = None
+
+        if not self.logged_in:
+            self._use_stage('login')
+            self.logged_in = self._restore_cookies() or self._login()
+
+        if self.logged_in:
+            self._use_stage(stage)
+        return self.driver if self.logged_in else None
+
+    def _use_stage(self, stage):
+        from utils.selenium_setup import block_resources
+
+        if stage != self.stage:
+            block_resources(self.driver, stage)
+            self.stage = stage
+
+    @timed('session.restore_cookies')
+    def _restore_cookies(self):
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from utils.wait_policy import wait_for_any
+        from utils.selenium_setup import load_page
+
+        cookies = load_session_cookies(self.cookie_file)
+        if not cookies:
+            return False
+
+        probed = self._probe_cookies(cookies)
+        if probed is not None:
+            return probed
+
+        logger.info("trying saved session cookies...")
+        try:
+            # cookies can only be set for the domain that is currently loaded
+            load_page(self.driver, os.getenv('LOGIN_URL'), 'login')
+            for cookie in cookies:
+                cookie.pop('sameSite', None)
+                self.driver.add_cookie(cookie)
+
+            # the upload page is only reachable with a valid session -- an expired one shows the login form
+            load_page(self.driver, os.getenv('UPLOAD_URL'), 'upload')
+            shown, _ = wait_for_any(self.driver, 'session.check', {
+                'upload': EC.presence_of_element_located((By.ID, 'formFile')),
+                'login': EC.presence_of_element_located((By.NAME, 'user')),
+            }, 5)
+            if shown == 'login':
+                raise ValueError('session expired')
+            logger.info("saved session is still valid. skipping login.")
+            return True
+        except Exception:
+            logger.info("saved session expired. logging in again...")
+            self.driver.delete_all_cookies()
+            return False
+
+    def _probe_cookies(self, cookies):
+        """check the saved cookies with one http request and, if they're still good, hand them to the
+        browser without loading a page. True/False if that settled it, None to check in the browser instead"""
+        from utils.http_session import SESSION_PROBE, get_http_session, probe_session
+
+        if not SESSION_PROBE:
+            return None
+        with get_http_session(self.cookie_file, cookies) as http:
+            valid = probe_session(http)
+        if valid is False:
+            logger.info("saved session expired (probe). logging in again...")
+        if not valid:
+            return valid
+        try:
+            for cookie in cookies:
+                params = {
+                    'name': cookie['name'], 'value': cookie['value'], 'path': cookie.get('path', '/'),
+                    'secure': cookie.get('secure', False), 'httpOnly': cookie.get('httpOnly', False),
+                }
+                if cookie.get('domain'):
+                    params['domain'] = cookie['domain']
+                else:
+                    params['url'] = os.getenv('LOGIN_URL')
+                if cookie.get('expiry'):
+                    params['expires'] = cookie['expiry']
+                # devtools can set cookies for a domain that isn't loaded, so no page load is needed
+                self.driver.execute_cdp_cmd('Network.setCookie', params)
+        except Exception as e:
+            logger.warning(f"could not hand the saved cookies to the browser: {e}")
+            return None
+        logger.info("saved session is still valid (probe). skipping login.")
+        return True
+
+    @timed('session.login')
+    def _login(self):
+        from utils.selenium_login import perfume_selenium_login
+
+        logged_in = perfume_selenium_login(self.driver, self.username, self.password)
+        if logged_in:
+            save_session_cookies(self.driver.get_cookies(), self.cookie_file)
+        return logged_in
+
+    def invalidate(self):
+        """force a fresh login the next time the driver is requested"""
+        self.logged_in = False
+
+    def close(self):
+        if self.driver is None:
+            return
+
+        try:
+            if self.logged_in:
+                save_session_cookies(self.driver.get_cookies(), self.cookie_file)
+            logger.info("quitting browser")
+            self.driver.quit()
+            logger.info("browser closed")
+        except Exception as e:
+            logger.warning(f"error closing browser: {e}")
+        finally:
+            self.driver = None
+            self.logged_in = False
+            self.stage = None
+            if self.download_dir:
+                shutil.rmtree(self.download_dir, ignore_errors=True)
+                self.download_dir = None
@@ -1,7 +1,12 @@
+import os
 import logging
+from dotenv import load_dotenv
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
+from utils.metrics import span, timed
+
+load_dotenv()
 
 # configure logging
 logging.basicConfig(
@@ -10,7 +15,65 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def get_headless_driver():
+# 'false' launches chrome the way it used to: full page loads, nothing blocked, background services on
+CHROME_LEAN = os.getenv('CHROME_LEAN', 'true').lower() in ('1', 'true', 'yes')
+# 'eager' returns from driver.get() at DOMContentLoaded; every step after that waits for its own element
+CHROME_PAGE_LOAD_STRATEGY = os.getenv('CHROME_PAGE_LOAD_STRATEGY', 'eager')
+# what to block on every page, comma separated (see BLOCK_PATTERNS) or 'none'.
+# CHROME_BLOCK_LOGIN / _ORDERS / _TRACKING override it for one stage
+CHROME_BLOCK = os.getenv('CHROME_BLOCK', 'images,fonts,media,analytics')
+
+BLOCK_PATTERNS = {
+    'images': ['*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico', '*.bmp'],
+    'fonts': ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot'],
+    'media': ['*.mp4', '*.webm', '*.mp3', '*.ogg', '*.wav', '*.m4a'],
+    'analytics': [
+        '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*connect.facebook.net*',
+        '*hotjar.com*', '*clarity.ms*', '*segment.io*', '*analytics.js*', '*gtag/js*',
+    ],
+    'stylesheets': ['*.css'],  # not blocked by default -- some pages hide buttons until their css loads
+}
+
+LEAN_ARGUMENTS = [
+    '--disable-background-networking',
+    '--disable-extensions',
+    '--disable-component-update',
+    '--disable-default-apps',
+    '--disable-sync',
+    '--disable-background-timer-throttling',
+    '--no-first-run',
+    '--no-default-browser-check',
+    '--mute-audio',
+]
+
+def blocked_url_patterns(stage=None):
+    setting = os.getenv(f"CHROME_BLOCK_{stage.upper()}", CHROME_BLOCK) if stage else CHROME_BLOCK
+    patterns = []
+    for group in setting.split(','):
+        group = group.strip().lower()
+        if group and group != 'none':
+            patterns.extend(BLOCK_PATTERNS.get(group, [group]))  # anything else is taken as a url pattern
+    return patterns
+
+def block_resources(driver, stage=None):
+    """block this stage's resource types through devtools. can be called again to switch stages"""
+    patterns = blocked_url_patterns(stage) if CHROME_LEAN else []
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+    except Exception as e:
+        logger.warning(f"could not set blocked urls: {e}")
+
+def load_page(driver, url, name):
+    """driver.get() timed as a page.<name> span, so page loads show up in the metrics"""
+    with span(f"page.{name}"):
+        driver.get(url)
+
+@timed('chrome.launch')
+def get_headless_driver(download_dir=None, profile_dir=None, lean=None):
+    """headless chrome. profile_dir keeps the profile (cache, cookies) on disk between runs; it can
+    only be used by one browser at a time"""
+    lean = CHROME_LEAN if lean is None else lean
     logger.info("Initializing Chrome driver...")
     chrome_options = Options()
     chrome_options.add_argument("--window-size=1920,1080")
@@ -19,6 +82,39 @@ def get_headless_driver():
     chrome_options.add_argument('--disable-gpu')
     chrome_options.add_argument('--disable-dev-shm-usage')
 
-    driver = webdriver.Chrome(options=chrome_options)
+    if lean:
+        chrome_options.page_load_strategy = CHROME_PAGE_LOAD_STRATEGY
+        for argument in LEAN_ARGUMENTS:
+            chrome_options.add_argument(argument)
+    if download_dir:
+        chrome_options.add_experimental_option('prefs', {
+            'download.default_directory': download_dir,
+            'download.prompt_for_download': False,
+        })
+
+    driver = None
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+        chrome_options.add_argument(f"--user-data-dir={profile_dir}")
+        try:
+            driver = webdriver.Chrome(options=chrome_options)
+        except Exception as e:
+            # most likely another run still has this profile open -- a throwaway profile still works
+            logger.warning(f"could not start chrome with profile {profile_dir} ({e}). using a temporary profile")
+            chrome_options.arguments.remove(f"--user-data-dir={profile_dir}")
+    if driver is None:
+        driver = webdriver.Chrome(options=chrome_options)
+
+    if download_dir:
+        # headless chrome ignores the download prefs unless it's told through devtools
+        driver.execute_cdp_cmd('Browser.setDownloadBehavior', {
+            'behavior': 'allow',
+            'downloadPath': download_dir,
+        })
+        logger.info(f"browser downloads will be saved to: {download_dir}")
+
+    if lean:
+        block_resources(driver)
+
     logger.info("Headless Chrome driver initialized successfully.")
-    return driver
\ No newline at end of file
+    return driver
@@ -0,0 +1,40 @@
+import os
+import json
+import time
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# where the vendor session cookies are kept between runs
+SESSION_COOKIE_FILE = os.getenv(
+    'SESSION_COOKIE_FILE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'session_cookies.json'),
+)
+
+def load_session_cookies(cookie_file=SESSION_COOKIE_FILE):
+    if not os.path.isfile(cookie_file):
+        return []
+
+    try:
+        with open(cookie_file) as f:
+            cookies = json.load(f)
+    except Exception as e:
+        logger.warning(f"could not read saved cookies from {cookie_file}: {e}")
+        return []
+
+    # drop anything that has already expired
+    now = time.time()
+    return [c for c in cookies if not c.get('expiry') or c['expiry'] > now]
+
+def save_session_cookies(cookies, cookie_file=SESSION_COOKIE_FILE):
+    tmp_file = f"{cookie_file}.tmp"
+    try:
+        with open(tmp_file, 'w') as f:
+            json.dump(cookies, f)
+        os.replace(tmp_file, cookie_file)  # atomic so a crash never leaves half a file
+        logger.info(f"saved {len(cookies)} session cookies to {cookie_file}")
+    except Exception as e:
+        logger.warning(f"could not save session cookies to {cookie_file}: {e}")
@@ -0,0 +1,98 @@
+import io
+import os
+import csv
+import logging
+from dotenv import load_dotenv
+
+# optional faster parser -- the stdlib csv module is used when it isn't installed
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+    pa_csv = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# columns with customer/pricing info that never go to /in/fulfillments
+TRACKING_COLUMNS_TO_REMOVE = [
+    "First Name", "Last Name", "Address 1", "Address 2",
+    "City", "State", "Zip", "SKU", "Pcs", "Unit Price",
+    "Shipping Cost", "Order Date"
+]
+
+TRACKING_CHUNK_ROWS = int(os.getenv('TRACKING_CHUNK_ROWS', 50000))
+
+def keep_tracking_column(column):
+    return column not in TRACKING_COLUMNS_TO_REMOVE
+
+def _read_header(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return next(csv.reader(f), None)
+
+def _iter_chunks_pyarrow(path, kept, chunk_rows):
+    # every kept column read as plain text so values are written back exactly as they came in
+    reader = pa_csv.open_csv(
+        path,
+        read_options=pa_csv.ReadOptions(block_size=1 << 22),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=kept,
+            column_types={column: pa.string() for column in kept},
+            strings_can_be_null=False,
+            quoted_strings_can_be_null=False,
+        ),
+    )
+    for batch in reader:
+        columns = [batch.column(i).to_pylist() for i in range(batch.num_columns)]
+        rows = list(zip(*columns))
+        for start in range(0, len(rows), chunk_rows):
+            yield rows[start:start + chunk_rows]
+
+def _iter_chunks_csv(reader, keep, chunk_rows):
+    chunk = []
+    for row in reader:
+        if not row:
+            continue  # pandas skips blank lines too
+        chunk.append([row[i] if i < len(row) else '' for i in keep])
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def filter_tracking_csv(source, destination, chunk_rows=TRACKING_CHUNK_ROWS):
+    """copy only the kept columns of a tracking export from source to destination, chunk_rows rows at a time.
+
+    source is a file path or a binary file object, destination a binary file object. values are
+    copied as text, never parsed, so memory stays flat no matter how big the export is.
+    returns the number of data rows written.
+    """
+    out = io.TextIOWrapper(destination, encoding='utf-8', newline='', write_through=True)
+    writer = csv.writer(out, lineterminator=os.linesep)  # same line ending pandas' to_csv uses
+    rows_written = 0
+
+    try:
+        if isinstance(source, (str, os.PathLike)) and pa_csv is not None and (header := _read_header(source)):
+            kept = [column for column in header if keep_tracking_column(column)]
+            chunks = _iter_chunks_pyarrow(source, kept, chunk_rows)
+        else:
+            text = open(source, newline='', encoding='utf-8-sig') if isinstance(source, (str, os.PathLike)) \
+                else io.TextIOWrapper(source, encoding='utf-8-sig', newline='')
+            reader = csv.reader(text)
+            header = next(reader, None) or []
+            keep = [i for i, column in enumerate(header) if keep_tracking_column(column)]
+            kept = [header[i] for i in keep]
+            chunks = _iter_chunks_csv(reader, keep, chunk_rows)
+
+        logger.info(f"keeping tracking columns: {kept}")
+        writer.writerow(kept)
+        for chunk in chunks:
+            writer.writerows(chunk)
+            rows_written += len(chunk)
+    finally:
+        out.detach()  # leave the destination open for the caller
+
+    return rows_written
@@ -0,0 +1,171 @@
+import io
+import os
+import csv
+import time
+import sqlite3
+import logging
+from dotenv import load_dotenv
+from utils.run_state import BASE_DIR
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# only push tracking rows that haven't been pushed before. off by default: each delta goes up under its
+# own timestamped name, so only turn it on once the importer picks up any file in /in/fulfillments
+TRACKING_DEDUP = os.getenv('TRACKING_DEDUP', 'false').lower() in ('1', 'true', 'yes')
+TRACKING_INDEX_FILE = os.getenv('TRACKING_INDEX_FILE', os.path.join(BASE_DIR, 'tracking_index.sqlite3'))
+# rows that haven't shown up in the export for this long are dropped from the index
+TRACKING_INDEX_TTL_DAYS = float(os.getenv('TRACKING_INDEX_TTL_DAYS', 90))
+# push the whole export again every N hours anyway (0 = never)
+TRACKING_FULL_RESYNC_HOURS = float(os.getenv('TRACKING_FULL_RESYNC_HOURS', 0))
+TRACKING_ORDER_ID_COLUMN = os.getenv('TRACKING_ORDER_ID_COLUMN', 'Order ID')
+TRACKING_NUMBER_COLUMN = os.getenv('TRACKING_NUMBER_COLUMN', 'Tracking Number')
+# rows per lookup query, kept under sqlite's bound parameter limit
+TRACKING_INDEX_BATCH = 500
+
+class TrackingIndex:
+    """sqlite index of (order id, tracking number) pairs already pushed to /in/fulfillments.
+
+    sent_at is when a row was uploaded, last_seen the last export it appeared in. rows whose
+    last_seen is older than the TTL are deleted, so the index only holds what the export still has.
+    """
+
+    def __init__(self, path=TRACKING_INDEX_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS sent ("
+                " order_id TEXT NOT NULL, tracking_number TEXT NOT NULL,"
+                " sent_at REAL NOT NULL, last_seen REAL NOT NULL,"
+                " PRIMARY KEY (order_id, tracking_number)) WITHOUT ROWID"
+            )
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def seen(self, keys, now=None):
+        """the subset of keys already in the index. one query per TRACKING_INDEX_BATCH keys,
+        and the matches get their last_seen bumped so they don't expire while still exported"""
+        now = now or time.time()
+        keys = list(keys)
+        found = set()
+        for start in range(0, len(keys), TRACKING_INDEX_BATCH):
+            batch = set(keys[start:start + TRACKING_INDEX_BATCH])
+            order_ids = list({order_id for order_id, _ in batch})
+            rows = self.conn.execute(
+                f"SELECT order_id, tracking_number FROM sent WHERE order_id IN ({','.join('?' * len(order_ids))})",
+                order_ids,
+            )
+            found.update(key for key in rows if key in batch)
+
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE sent SET last_seen = ? WHERE order_id = ? AND tracking_number = ?",
+                [(now, order_id, tracking_number) for order_id, tracking_number in found],
+            )
+        return found
+
+    def mark_sent(self, keys, now=None):
+        """record keys as uploaded. only call this once the FTP upload went through"""
+        now = now or time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO sent (order_id, tracking_number, sent_at, last_seen) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (order_id, tracking_number) DO UPDATE SET sent_at = excluded.sent_at, last_seen = excluded.last_seen",
+                [(order_id, tracking_number, now, now) for order_id, tracking_number in keys],
+            )
+        logger.info(f"tracking index: marked {len(keys)} row(s) as sent")
+
+    def compact(self, ttl_days=TRACKING_INDEX_TTL_DAYS):
+        with self.conn:
+            deleted = self.conn.execute("DELETE FROM sent WHERE last_seen < ?", (time.time() - ttl_days * 86400,)).rowcount
+        if deleted:
+            logger.info(f"tracking index: dropped {deleted} row(s) not seen in {ttl_days:g} days")
+            self.conn.execute("VACUUM")
+        return deleted
+
+    def _get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def full_resync_due(self, hours=TRACKING_FULL_RESYNC_HOURS):
+        if hours <= 0:
+            return False
+        last = self._get_meta('last_full_resync')
+        return last is None or time.time() - last >= hours * 3600
+
+    def record_full_resync(self):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_full_resync', ?)", (time.time(),))
+
+def open_tracking_index():
+    """the index if TRACKING_DEDUP is on, else None. a broken index file just turns dedup off for this run"""
+    if not TRACKING_DEDUP:
+        return None
+    try:
+        return TrackingIndex()
+    except sqlite3.Error as e:
+        logger.error(f"could not open tracking index {TRACKING_INDEX_FILE}: {e}. uploading every row")
+        return None
+
+def filter_unsent_rows(source, destination, index, full_resync=False):
+    """copy the header and the rows whose (order id, tracking number) isn't in the index.
+
+    source and destination are binary file objects holding an already column-filtered export.
+    with full_resync every row is copied. returns (rows written, their keys) -- pass the keys to
+    index.mark_sent() after the upload succeeds.
+    """
+    text = io.TextIOWrapper(source, encoding='utf-8-sig', newline='')
+    out = io.TextIOWrapper(destination, encoding='utf-8', newline='', write_through=True)
+    writer = csv.writer(out, lineterminator=os.linesep)
+    keys_written = []
+
+    try:
+        reader = csv.reader(text)
+        header = next(reader, None) or []
+        writer.writerow(header)
+        if TRACKING_ORDER_ID_COLUMN not in header or TRACKING_NUMBER_COLUMN not in header:
+            logger.warning(f"tracking export has no '{TRACKING_ORDER_ID_COLUMN}'/'{TRACKING_NUMBER_COLUMN}' column. uploading every row")
+            rows = [row for row in reader if row]
+            writer.writerows(rows)
+            return len(rows), []
+
+        order_col = header.index(TRACKING_ORDER_ID_COLUMN)
+        tracking_col = header.index(TRACKING_NUMBER_COLUMN)
+        written = set()
+        chunk = []
+
+        def flush(chunk):
+            keyed = [((row[order_col], row[tracking_col]), row) for row in chunk]
+            already_sent = set() if full_resync else index.seen(key for key, _ in keyed)
+            for key, row in keyed:
+                if key in already_sent or key in written:
+                    continue
+                written.add(key)
+                keys_written.append(key)
+                writer.writerow(row)
+
+        for row in reader:
+            if not row:
+                continue
+            row += [''] * (len(header) - len(row))
+            chunk.append(row)
+            if len(chunk) >= TRACKING_INDEX_BATCH:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+    finally:
+        text.detach()
+        out.detach()  # leave both file objects open for the caller
+
+    return len(keys_written), keys_written
@@ -0,0 +1,136 @@
+import os
+import time
+import atexit
+import random
+import logging
+import threading
+from dotenv import load_dotenv
+from utils.run_state import BASE_DIR, load_state, save_state
+from utils.metrics import span
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# how long each named wait really took, kept across runs so timeouts can follow the vendor's actual speed
+WAIT_STATS_FILE = os.getenv('WAIT_STATS_FILE', os.path.join(BASE_DIR, 'wait_stats.json'))
+WAIT_ADAPTIVE = os.getenv('WAIT_ADAPTIVE', 'true').lower() in ('1', 'true', 'yes')
+WAIT_MIN_SAMPLES = int(os.getenv('WAIT_MIN_SAMPLES', 20)) # below this the fixed default timeout is used
+WAIT_HEADROOM = float(os.getenv('WAIT_HEADROOM', 2.0)) # timeout = p99 x this ...
+WAIT_MIN_TIMEOUT = float(os.getenv('WAIT_MIN_TIMEOUT', 3.0)) # ... but never below this (seconds) or above the default
+# waits on the vendor finishing real work (after the submit/login click, the export build) keep their
+# fixed default -- giving up early there means a batch or login in an unknown state, not a faster run
+WAIT_FIXED = {name.strip() for name in os.getenv(
+    'WAIT_FIXED', 'upload.confirmation,login.welcome,tracking.confirm'
+).split(',') if name.strip()}
+WAIT_MAX_SAMPLES = 200 # per wait, oldest dropped first
+WAIT_SAVE_INTERVAL = 30 # seconds between writes of the stats file
+
+_lock = threading.Lock()
+_samples = None
+_last_save = 0.0
+
+def _load():
+    global _samples
+    if _samples is None:
+        _samples = {name: list(stats.get('samples', [])) for name, stats in load_state(WAIT_STATS_FILE).items()}
+    return _samples
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def save_wait_stats():
+    global _last_save
+    with _lock:
+        if _samples is None:
+            return
+        state = {
+            name: {
+                'p50': percentile(samples, 50), 'p90': percentile(samples, 90), 'p99': percentile(samples, 99),
+                'samples': samples,
+            }
+            for name, samples in _samples.items()
+        }
+        _last_save = time.monotonic()
+    try:
+        save_state(state, WAIT_STATS_FILE)
+    except OSError as e:
+        logger.warning(f"could not save wait stats: {e}")
+
+def record_wait(name, seconds):
+    with _lock:
+        samples = _load().setdefault(name, [])
+        samples.append(round(seconds, 3))
+        del samples[:-WAIT_MAX_SAMPLES]
+        due = time.monotonic() - _last_save > WAIT_SAVE_INTERVAL
+    if due:
+        save_wait_stats()
+
+def timeout_for(name, default):
+    """p99 of the recorded waits times WAIT_HEADROOM, between WAIT_MIN_TIMEOUT and the old fixed default"""
+    if not WAIT_ADAPTIVE or name in WAIT_FIXED:
+        return default
+    with _lock:
+        samples = list(_load().get(name, []))
+    if len(samples) < WAIT_MIN_SAMPLES:
+        return default
+    return min(default, max(WAIT_MIN_TIMEOUT, percentile(samples, 99) * WAIT_HEADROOM))
+
+def _first_match(conditions):
+    from selenium.common.exceptions import WebDriverException
+
+    def check(driver):
+        for label, condition in conditions.items():
+            try:
+                result = condition(driver)
+            except WebDriverException:
+                result = False
+            if result:
+                return label, result
+        return False
+    return check
+
+def wait_for_any(driver, name, conditions, default_timeout):
+    """wait until the first of several expected conditions holds and return (label, result).
+
+    conditions is {label: EC condition}, checked in order on every poll, so an optional prompt
+    is noticed the moment it shows up instead of costing a full timeout when it doesn't.
+    raises TimeoutException if none of them hold in time.
+    """
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.common.exceptions import TimeoutException
+
+    timeout = timeout_for(name, default_timeout)
+    start = time.monotonic()
+    with span(f"wait.{name}", timeout=round(timeout, 1)) as attrs:
+        try:
+            label, result = WebDriverWait(driver, timeout, poll_frequency=0.1).until(_first_match(conditions))
+        except TimeoutException:
+            # a timeout counts as a slow sample so the next timeout grows back towards the default
+            record_wait(name, timeout)
+            raise
+        attrs['matched'] = label
+    record_wait(name, time.monotonic() - start)
+    return label, result
+
+def wait_until(driver, name, condition, default_timeout):
+    """WebDriverWait(driver, timeout).until(condition) with a learned timeout. returns the condition's result"""
+    return wait_for_any(driver, name, {name: condition}, default_timeout)[1]
+
+def backoff_delay(attempt, base, cap=60.0):
+    """exponential backoff with jitter: about base, 2*base, 4*base... (attempt 0, 1, 2...), capped.
+    half of each delay is random so retries from several workers don't line up"""
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+atexit.register(save_wait_stats)
+
+if __name__ == '__main__':
+    # python -m utils.wait_policy  -- show what's been learned
+    for name, samples in sorted(_load().items()):
+        print(f"{name:28s} n={len(samples):4d}  p50={percentile(samples, 50):7.2f}s  p90={percentile(samples, 90):7.2f}s  "
+              f"p99={percentile(samples, 99):7.2f}s")